@@ -48,6 +48,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'run.routers.replica_pin_middleware',
 ]
 
 ROOT_URLCONF = 'PacePower.urls'
@@ -63,6 +64,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'run.context_processors.goals',
             ],
         },
     },
@@ -85,6 +87,55 @@ DATABASES = {
     }
 }
 
+# Read replica for analytics pages; without PACEPOWER_REPLICA_* it stands in as
+# a second connection to the primary. Tests mirror it onto 'default'.
+DATABASES['replica'] = {
+    **DATABASES['default'],
+    'NAME': os.environ.get('PACEPOWER_REPLICA_NAME', DATABASES['default']['NAME']),
+    'HOST': os.environ.get('PACEPOWER_REPLICA_HOST', DATABASES['default']['HOST']),
+    'PORT': os.environ.get('PACEPOWER_REPLICA_PORT', DATABASES['default']['PORT']),
+    'TEST': {'MIRROR': 'default'},
+}
+
+DATABASE_ROUTERS = ['run.routers.ReplicaRouter']
+
+# Seconds a user keeps reading from the primary after a write
+REPLICA_PIN_SECONDS = 10
+
+# Data versions, replica pins and rendered fragments live in the cache, so it must
+# be shared by every worker process. PACEPOWER_REDIS_URL switches to Redis (needs
+# the redis package); the default is tables made by `manage.py createcachetable`.
+#
+# Versions and pins go to 'state', which must never evict them: a lost pin breaks
+# read-your-writes. The database cache culls a share of its rows in key order once
+# MAX_ENTRIES is passed, so both limits sit far above what the app stores; 'state'
+# holds a few keys per user and 'default' drops expired fragments first.
+if os.environ.get('PACEPOWER_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['PACEPOWER_REDIS_URL'],
+        },
+        'state': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['PACEPOWER_REDIS_URL'],
+            'KEY_PREFIX': 'state',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'pacepower_cache',
+            'OPTIONS': {'MAX_ENTRIES': 1_000_000},
+        },
+        'state': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'pacepower_state_cache',
+            'OPTIONS': {'MAX_ENTRIES': 100_000_000},
+        },
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -1,11 +1,112 @@
+import json
 from django.contrib import admin
-from .models import Run, Profile, TrainingPlan, PlannedRun, HeartRateZone, Tag
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from .models import Run, Profile, TrainingPlan, PlannedRun, HeartRateZone, Tag, Job
 
 
-# Admin access for classes below
-admin.site.register(Run)
-admin.site.register(Profile)
-admin.site.register(TrainingPlan)
-admin.site.register(PlannedRun)
-admin.site.register(HeartRateZone)
-admin.site.register(Tag)
+EXACT_COUNT_BELOW = 10_000
+FILTERED_COUNT_CAP = 10_000
+
+
+# Planner's row estimate for a table, summed over its partitions; None if never analyzed
+def estimated_row_count(db_alias, table):
+    connection = connections[db_alias]
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT SUM(GREATEST(c.reltuples, 0)), BOOL_OR(c.reltuples >= 0) FROM pg_class c "
+            "WHERE c.oid = to_regclass(%s) OR c.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = to_regclass(%s))",
+            [table, table],
+        )
+        total, analyzed = cursor.fetchone()
+    return int(total) if analyzed else None
+
+
+# Planner's row estimate for a queryset; None off PostgreSQL
+def estimated_query_rows(qs):
+    if connections[qs.db].vendor != "postgresql":
+        return None
+    plan = json.loads(qs.order_by().explain(format="json"))
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+# Paginator that never runs an exact COUNT(*) over a whole large table
+class EstimatedCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        qs = self.object_list
+        if not qs.query.where:
+            estimate = estimated_row_count(qs.db, qs.model._meta.db_table)
+            if estimate is not None and estimate >= EXACT_COUNT_BELOW:
+                return estimate
+            return super().count
+        # filtered changelists count exactly up to a bounded number of rows; past
+        # that the planner's estimate keeps the later pages reachable
+        counted = qs[:FILTERED_COUNT_CAP].count()
+        if counted < FILTERED_COUNT_CAP:
+            return counted
+        return max(counted, estimated_query_rows(qs) or 0)
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+
+@admin.register(Run)
+class RunAdmin(LargeTableAdmin):
+    list_display = ("id", "user", "date", "run_type", "distance_km", "pace_min_km")
+    list_select_related = ("user",)
+    list_filter = ("date",)
+    raw_id_fields = ("user",)
+    autocomplete_fields = ("tags",)
+    readonly_fields = ("updated_at",)
+
+
+@admin.register(PlannedRun)
+class PlannedRunAdmin(LargeTableAdmin):
+    list_display = ("id", "user", "plan", "date", "run_type", "distance_km", "pace_target")
+    list_select_related = ("user", "plan")
+    list_filter = ("date",)
+    raw_id_fields = ("user", "plan")
+    readonly_fields = ("updated_at",)
+
+
+@admin.register(Tag)
+class TagAdmin(LargeTableAdmin):
+    list_display = ("name", "user")
+    list_select_related = ("user",)
+    search_fields = ("name",)
+    raw_id_fields = ("user",)
+
+
+@admin.register(TrainingPlan)
+class TrainingPlanAdmin(LargeTableAdmin):
+    list_display = ("name", "user", "start_date")
+    list_select_related = ("user",)
+    raw_id_fields = ("user",)
+
+
+@admin.register(Profile)
+class ProfileAdmin(LargeTableAdmin):
+    list_select_related = ("user",)
+    raw_id_fields = ("user",)
+
+
+@admin.register(HeartRateZone)
+class HeartRateZoneAdmin(LargeTableAdmin):
+    list_display = ("profile", "zone_number", "hr_min", "hr_max")
+    list_select_related = ("profile__user",)
+    raw_id_fields = ("profile",)
+
+
+@admin.register(Job)
+class JobAdmin(LargeTableAdmin):
+    list_display = ("id", "kind", "user", "status", "attempts", "progress", "progress_total", "run_after")
+    list_select_related = ("user",)
+    list_filter = ("status",)
+    raw_id_fields = ("user",)
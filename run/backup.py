@@ -0,0 +1,252 @@
+import base64
+import io
+import json
+import zipfile
+from datetime import date as _date, time as _time
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from .goals import reconcile_user
+from .models import (
+    Goal, HeartRateStream, HeartRateZone, Lap, PlannedRun, Profile, Run, Tag, TrainingPlan, run_fingerprint,
+)
+from .versioning import bump_version
+from .zone_time import update_zone_weeks
+
+
+BACKUP_FORMAT = 1
+PAGE_SIZE = 2000
+BATCH_SIZE = 1000
+# an HR stream is up to a day of 1 Hz samples, a third larger once base64 encoded
+STREAM_PAGE_SIZE = 4
+
+RUN_FIELDS = ["id", "date", "start_time", "run_type", "distance_km", "pace_min_km", "heart_rate", "zone", "notes", "fingerprint", "imported"]
+PLANNED_FIELDS = ["id", "plan_id", "date", "run_type", "distance_km", "pace_target", "notes"]
+LAP_FIELDS = ["id", "run_id", "number", "distance_km", "duration_seconds", "heart_rate"]
+
+
+class BackupError(ValueError):
+    pass
+
+
+# Write-only file object that hands what zipfile wrote to a generator; it cannot
+# seek, so zipfile puts sizes in data descriptors instead of going back
+class _StreamBuffer(io.RawIOBase):
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+# Rows of a values() queryset in id order, one page per query
+def _pages(qs, size=PAGE_SIZE):
+    last_id = 0
+    while True:
+        page = list(qs.filter(id__gt=last_id).order_by("id")[:size])
+        if not page:
+            return
+        yield page
+        last_id = page[-1]["id"]
+
+
+def _run_pages(user_id, using):
+    links = Run.tags.through.objects.using(using)
+    for page in _pages(Run.objects.using(using).filter(user_id=user_id).values(*RUN_FIELDS)):
+        tags = {}
+        for run_id, tag_id in links.filter(run_id__in=[r["id"] for r in page]).values_list("run_id", "tag_id"):
+            tags.setdefault(run_id, []).append(tag_id)
+        for run in page:
+            run["tags"] = sorted(tags.get(run["id"], []))
+        yield page
+
+
+def _stream_pages(user_id, using):
+    qs = HeartRateStream.objects.using(using).filter(user_id=user_id).values("id", "run_id", "samples")
+    for page in _pages(qs, STREAM_PAGE_SIZE):
+        for row in page:
+            row["samples"] = base64.b64encode(bytes(row["samples"])).decode()
+        yield page
+
+
+def _profile_pages(user_id, using):
+    zones = HeartRateZone.objects.using(using).filter(profile__user_id=user_id).order_by("zone_number")
+    if Profile.objects.using(using).filter(user_id=user_id).exists():
+        yield [{"zones": list(zones.values("zone_number", "hr_min", "hr_max"))}]
+
+
+# Files of a backup in restore order, each a generator of row pages
+def _sections(user_id, using):
+    return [
+        ("profile.jsonl", _profile_pages(user_id, using)),
+        ("tags.jsonl", _pages(Tag.objects.using(using).filter(user_id=user_id).values("id", "name"))),
+        ("training_plans.jsonl", _pages(TrainingPlan.objects.using(using).filter(user_id=user_id).values("id", "name", "description", "start_date"))),
+        ("planned_runs.jsonl", _pages(PlannedRun.objects.using(using).filter(user_id=user_id).values(*PLANNED_FIELDS))),
+        ("runs.jsonl", _run_pages(user_id, using)),
+        ("laps.jsonl", _pages(Lap.objects.using(using).filter(user_id=user_id).values(*LAP_FIELDS))),
+        ("hr_streams.jsonl", _stream_pages(user_id, using)),
+        ("goals.jsonl", _pages(Goal.objects.using(using).filter(user_id=user_id).values("id", "metric", "period", "target"))),
+    ]
+
+
+# The account as a ZIP with one JSONL file per model, produced page by page so
+# memory stays bounded by PAGE_SIZE rows (STREAM_PAGE_SIZE HR streams) whatever
+# the account size
+def generate_backup(user, using="default"):
+    out = _StreamBuffer()
+    with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        manifest = {"format": BACKUP_FORMAT, "username": user.username, "exported_at": timezone.now()}
+        zf.writestr("manifest.json", json.dumps(manifest, cls=DjangoJSONEncoder))
+        for name, pages in _sections(user.pk, using):
+            with zf.open(name, "w", force_zip64=True) as fh:
+                for page in pages:
+                    fh.write("".join(json.dumps(row, cls=DjangoJSONEncoder) + "\n" for row in page).encode())
+                    yield out.drain()
+            yield out.drain()
+    yield out.drain()
+
+
+def _rows(zf, name):
+    if name not in zf.namelist():
+        return
+    with zf.open(name) as fh:
+        for line in io.TextIOWrapper(fh, encoding="utf-8"):
+            if line.strip():
+                yield json.loads(line)
+
+
+def _batches(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _date_or_none(value):
+    return _date.fromisoformat(value) if value else None
+
+
+# Unsaved run of a runs.jsonl row; the stored fingerprint hashes the old account's
+# user id, so it is computed again for the new owner. Backups made before runs
+# were flagged as imported restore as logged by hand.
+def _restored_run(user, row):
+    run = Run(
+        user=user, date=_date.fromisoformat(row["date"]),
+        start_time=_time.fromisoformat(row["start_time"]) if row["start_time"] else None,
+        run_type=row["run_type"], distance_km=row["distance_km"], pace_min_km=row["pace_min_km"],
+        heart_rate=row["heart_rate"], zone=row["zone"], notes=row["notes"], imported=row.get("imported", False),
+    )
+    run.fingerprint = run_fingerprint(user.pk, run.date, run.distance_km, run.pace_min_km, run.start_time)
+    return run
+
+
+# Load a backup into an account without runs or plans; returns rows created per file.
+# Old ids are mapped to new ones as rows are inserted, so laps, streams, planned
+# runs and run tags point at the restored rows.
+def restore_backup(user, fileobj):
+    try:
+        zf = zipfile.ZipFile(fileobj)
+        manifest = json.loads(zf.read("manifest.json"))
+    except (zipfile.BadZipFile, KeyError, ValueError):
+        raise BackupError("Not a PacePower backup")
+    if manifest.get("format") != BACKUP_FORMAT:
+        raise BackupError(f"Unsupported backup format {manifest.get('format')!r}")
+    if Run.objects.filter(user=user).exists() or TrainingPlan.objects.filter(user=user).exists():
+        raise BackupError(f"User {user.username!r} already has runs or plans, restore into an empty account")
+
+    counts = {}
+    with transaction.atomic():
+        for row in _rows(zf, "profile.jsonl"):
+            profile, _ = Profile.objects.get_or_create(user=user)
+            profile.zones.all().delete()
+            HeartRateZone.objects.bulk_create([HeartRateZone(profile=profile, **zone) for zone in row["zones"]])
+            counts["profile.jsonl"] = 1
+
+        tag_ids = dict(Tag.objects.filter(user=user).values_list("name", "id"))
+        tag_map = {}
+        for batch in _batches(_rows(zf, "tags.jsonl")):
+            new = [Tag(user=user, name=row["name"]) for row in batch if row["name"] not in tag_ids]
+            for tag in Tag.objects.bulk_create(new):
+                tag_ids[tag.name] = tag.pk
+            tag_map.update((row["id"], tag_ids[row["name"]]) for row in batch)
+            counts["tags.jsonl"] = counts.get("tags.jsonl", 0) + len(new)
+
+        plan_map = {}
+        for batch in _batches(_rows(zf, "training_plans.jsonl")):
+            plans = TrainingPlan.objects.bulk_create([
+                TrainingPlan(user=user, name=row["name"], description=row["description"], start_date=_date_or_none(row["start_date"]))
+                for row in batch
+            ])
+            plan_map.update((row["id"], plan.pk) for row, plan in zip(batch, plans))
+            counts["training_plans.jsonl"] = counts.get("training_plans.jsonl", 0) + len(plans)
+
+        for batch in _batches(_rows(zf, "planned_runs.jsonl")):
+            PlannedRun.objects.bulk_create([
+                PlannedRun(
+                    user=user, plan_id=plan_map.get(row["plan_id"]), date=_date.fromisoformat(row["date"]),
+                    run_type=row["run_type"], distance_km=row["distance_km"], pace_target=row["pace_target"], notes=row["notes"],
+                )
+                for row in batch
+            ])
+            counts["planned_runs.jsonl"] = counts.get("planned_runs.jsonl", 0) + len(batch)
+
+        run_map, years = {}, set()
+        for batch in _batches(_rows(zf, "runs.jsonl")):
+            runs = Run.objects.bulk_create([_restored_run(user, row) for row in batch])
+            links = []
+            for row, run in zip(batch, runs):
+                run_map[row["id"]] = run.pk
+                years.add(run.date.year)
+                links.extend(Run.tags.through(run_id=run.pk, tag_id=tag_map[t]) for t in row["tags"] if t in tag_map)
+            Run.tags.through.objects.bulk_create(links, batch_size=BATCH_SIZE)
+            counts["runs.jsonl"] = counts.get("runs.jsonl", 0) + len(runs)
+
+        for batch in _batches(_rows(zf, "laps.jsonl")):
+            laps = Lap.objects.bulk_create([
+                Lap(user=user, run_id=run_map[row["run_id"]], number=row["number"], distance_km=row["distance_km"],
+                    duration_seconds=row["duration_seconds"], heart_rate=row["heart_rate"])
+                for row in batch if row["run_id"] in run_map
+            ])
+            counts["laps.jsonl"] = counts.get("laps.jsonl", 0) + len(laps)
+
+        for batch in _batches(_rows(zf, "hr_streams.jsonl"), STREAM_PAGE_SIZE):
+            streams = HeartRateStream.objects.bulk_create([
+                HeartRateStream(user=user, run_id=run_map[row["run_id"]], samples=base64.b64decode(row["samples"]))
+                for row in batch if row["run_id"] in run_map
+            ])
+            counts["hr_streams.jsonl"] = counts.get("hr_streams.jsonl", 0) + len(streams)
+
+        for batch in _batches(_rows(zf, "goals.jsonl")):
+            Goal.objects.bulk_create(
+                [Goal(user=user, metric=row["metric"], period=row["period"], target=row["target"]) for row in batch],
+                ignore_conflicts=True,
+            )
+            counts["goals.jsonl"] = counts.get("goals.jsonl", 0) + len(batch)
+
+        # bulk inserts send no signals, rebuild what they would have maintained
+        reconcile_user(user.pk)
+        update_zone_weeks(user.pk)
+        bump_version(user.pk, "runs", "planned", *(f"runs:{y}" for y in sorted(years)))
+    return counts
+
+
+def backup_filename(user) -> str:
+    return f"pacepower-{user.username}-{timezone.localdate():%Y%m%d}.zip"
@@ -0,0 +1,182 @@
+import asyncio
+import http.client
+import io
+import math
+import sys
+import time
+from datetime import date as _date, timedelta
+from urllib.parse import urlencode, urlsplit
+from django.conf import settings
+from django.middleware.csrf import CSRF_SECRET_LENGTH
+from django.test import Client
+from django.utils.crypto import get_random_string
+
+
+# Session cookie header for a user, without going through the login form
+def session_cookie(user) -> str:
+    client = Client()
+    client.force_login(user)
+    return f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+
+
+# Cookie and X-CSRFToken headers that pass CsrfViewMiddleware, as a browser would send them
+def csrf_headers(cookie: str):
+    token = get_random_string(CSRF_SECRET_LENGTH)
+    return [("cookie", f"{cookie}; {settings.CSRF_COOKIE_NAME}={token}"), ("x-csrftoken", token)]
+
+
+# Drive a WSGI application in-process with a single HTTP request
+def wsgi_request(app, path, method="GET", body=b"", headers=()):
+    path, _, query = path.partition("?")
+    environ = {
+        "REQUEST_METHOD": method,
+        "SCRIPT_NAME": "",
+        "PATH_INFO": path,
+        "QUERY_STRING": query,
+        "SERVER_NAME": "localhost",
+        "SERVER_PORT": "80",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "REMOTE_ADDR": "127.0.0.1",
+        "HTTP_HOST": "localhost",
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": "http",
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in headers:
+        key = name.upper().replace("-", "_")
+        environ[key if key == "CONTENT_TYPE" else f"HTTP_{key}"] = value
+    response = {"status": None, "body": b""}
+
+    def start_response(status, response_headers, exc_info=None):
+        response["status"] = int(status.split()[0])
+        return lambda data: None
+
+    result = app(environ, start_response)
+    try:
+        response["body"] = b"".join(result)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return response
+
+
+# Send one request to a running server, e.g. base_url "http://127.0.0.1:8000"
+def http_request(base_url, path, method="GET", body=b"", headers=()):
+    url = urlsplit(base_url)
+    conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+    try:
+        conn.request(method, url.path.rstrip("/") + path, body=body or None, headers=dict(headers))
+        resp = conn.getresponse()
+        return {"status": resp.status, "body": resp.read()}
+    finally:
+        conn.close()
+
+
+# Drive an ASGI application in-process with a single HTTP request
+async def asgi_request(app, path, method="GET", body=b"", headers=()):
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(b"host", b"localhost"), *((k.encode(), v.encode()) for k, v in headers)],
+        "client": ("127.0.0.1", 0),
+        "server": ("localhost", 80),
+    }
+    pending = [{"type": "http.request", "body": body, "more_body": False}]
+    response = {"status": None, "body": b""}
+
+    async def receive():
+        if pending:
+            return pending.pop()
+        # the client stays connected until the handler cancels this wait
+        await asyncio.Future()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+
+    await app(scope, receive, send)
+    return response
+
+
+# Wall time in milliseconds of awaiting a fresh coroutine
+async def timed(make_coro) -> float:
+    start = time.perf_counter()
+    await make_coro()
+    return (time.perf_counter() - start) * 1000
+
+
+# Nearest-rank percentile of a list of samples
+def percentile(samples, pct) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+# Default traffic mix of the load test, as relative weights
+TRAFFIC_MIX = {"run_list": 50, "calendar": 20, "run_create": 20, "profile_edit": 10}
+FORM_TYPE = ("content-type", "application/x-www-form-urlencoded")
+
+
+# One logged-in user of the load test; next_request() picks an action from the mix
+# and returns (action, method, path, body, headers)
+class SimulatedUser:
+    def __init__(self, user, zones, rng, mix=None):
+        self.headers = csrf_headers(session_cookie(user))
+        self.zones = zones
+        self.rng = rng
+        self.actions = list((mix or TRAFFIC_MIX).items())
+
+    def next_request(self):
+        action = self.rng.choices([a for a, _ in self.actions], weights=[w for _, w in self.actions])[0]
+        return (action, *getattr(self, action)())
+
+    def run_list(self):
+        page = self.rng.choice([1, 1, 1, 2, 3])
+        return "GET", f"/runs/?page={page}", b"", self.headers
+
+    def calendar(self):
+        day = _date.today() - timedelta(days=31 * self.rng.randrange(3))
+        return "GET", f"/calendar/?year={day.year}&month={day.month}", b"", self.headers
+
+    # half of the visits to the form end in a saved run
+    def run_create(self):
+        if self.rng.random() < 0.5:
+            return "GET", "/runs/new/", b"", self.headers
+        form = {
+            "date": (_date.today() - timedelta(days=self.rng.randrange(60))).isoformat(),
+            "run_type": self.rng.choice(["EASY", "LONG", "TEMPO"]),
+            "distance_km": f"{self.rng.uniform(3, 21):.2f}",
+            "pace_min_km": f"{self.rng.randint(4, 6)}:{self.rng.randint(0, 59):02d}",
+            "heart_rate": str(self.rng.randint(120, 175)),
+        }
+        return "POST", "/runs/new/", urlencode(form).encode(), [*self.headers, FORM_TYPE]
+
+    # mostly viewing, sometimes saving the zones unchanged
+    def profile_edit(self):
+        if self.rng.random() < 0.8:
+            return "GET", "/profile/edit/", b"", self.headers
+        form = {
+            "form-TOTAL_FORMS": len(self.zones),
+            "form-INITIAL_FORMS": len(self.zones),
+            "form-MIN_NUM_FORMS": 0,
+            "form-MAX_NUM_FORMS": 1000,
+        }
+        for i, (pk, number, lo, hi) in enumerate(self.zones):
+            form.update({f"form-{i}-id": pk, f"form-{i}-zone_number": number, f"form-{i}-hr_min": lo, f"form-{i}-hr_max": hi})
+        return "POST", "/profile/edit/", urlencode(form).encode(), [*self.headers, FORM_TYPE]
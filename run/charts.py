@@ -0,0 +1,172 @@
+from datetime import date as _date, timedelta
+from django.core.cache import cache
+from django.db.models import Avg, F, FloatField, Sum
+from django.db.models.functions import Cast, Trunc
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+from .models import Run, heart_rate_expression, pace_seconds_expression
+from .routers import primary_if_pinned
+from .versioning import get_version
+
+
+MAX_POINTS = 120
+# the HR series is averaged in the database into at most this many buckets, then
+# downsampled to MAX_POINTS by LTTB
+HR_BUCKET_POINTS = MAX_POINTS * 8
+ROLLING_BUCKETS = 4
+CHART_CACHE_SECONDS = 60 * 60 * 24
+WIDTH, HEIGHT, PAD = 600, 180, 30
+BUCKET_DAYS = [("week", 7), ("month", 31), ("quarter", 92), ("year", 366)]
+
+
+# Smallest calendar bucket that keeps the range within max_points
+def bucket_for_range(start, end, max_points=MAX_POINTS, buckets=BUCKET_DAYS) -> str:
+    days = (end - start).days + 1
+    for kind, length in buckets:
+        if days / length <= max_points:
+            return kind
+    return "year"
+
+
+# Distance and distance-weighted pace per bucket, aggregated in the database
+def bucketed_volume_and_pace(user_id, start, end, kind):
+    rows = (
+        Run.objects.filter(user_id=user_id, date__gte=start, date__lte=end)
+        .annotate(bucket=Trunc("date", kind))
+        .values("bucket")
+        .annotate(
+            km=Sum("distance_km"),
+            pace_km=Sum(Cast(pace_seconds_expression(), FloatField()) * F("distance_km")),
+        )
+        .order_by("bucket")
+    )
+    volume = [(r["bucket"], r["km"]) for r in rows]
+    pace = [(r["bucket"], r["pace_km"] / r["km"]) for r in rows if r["km"]]
+    return volume, pace
+
+
+# Trailing mean over the last n points
+def rolling_mean(points, n=ROLLING_BUCKETS):
+    out = []
+    for i, (x, _) in enumerate(points):
+        window = [y for _, y in points[max(0, i - n + 1):i + 1]]
+        out.append((x, sum(window) / len(window)))
+    return out
+
+
+# Largest-Triangle-Three-Buckets downsampling, keeps the visual shape of a series
+def lttb(points, threshold=MAX_POINTS):
+    if threshold >= len(points) or threshold < 3:
+        return list(points)
+    xs = [p[0].toordinal() for p in points]
+    ys = [p[1] for p in points]
+    every = (len(points) - 2) / (threshold - 2)
+    sampled = [points[0]]
+    a = 0
+    for i in range(threshold - 2):
+        lo = int(i * every) + 1
+        hi = int((i + 1) * every) + 1
+        next_lo, next_hi = hi, min(int((i + 2) * every) + 1, len(points))
+        avg_x = sum(xs[next_lo:next_hi]) / (next_hi - next_lo)
+        avg_y = sum(ys[next_lo:next_hi]) / (next_hi - next_lo)
+        best, best_area = lo, -1.0
+        for j in range(lo, hi):
+            area = abs((xs[a] - avg_x) * (ys[j] - ys[a]) - (xs[a] - xs[j]) * (avg_y - ys[a]))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(points[best])
+        a = best
+    sampled.append(points[-1])
+    return sampled
+
+
+# Heart rate over time: averaged per day (or longer bucket) in the database, so the
+# query returns at most HR_BUCKET_POINTS rows, then downsampled to MAX_POINTS
+def heart_rate_series(user_id, start, end):
+    kind = bucket_for_range(start, end, HR_BUCKET_POINTS, [("day", 1)] + BUCKET_DAYS)
+    rows = (
+        Run.objects.filter(user_id=user_id, date__gte=start, date__lte=end)
+        .exclude(heart_rate="")
+        .annotate(bucket=Trunc("date", kind))
+        .values("bucket")
+        .annotate(hr=Avg(heart_rate_expression()))
+        .order_by("bucket")
+    )
+    return lttb([(r["bucket"], r["hr"]) for r in rows if r["hr"] is not None])
+
+
+# Map (date, value) points to SVG coordinates; buckets may start before the range
+def _scale(points, start, end, floor=None):
+    span_x = max((end - start).days, 1)
+    ys = [y for _, y in points]
+    lo, hi = min(ys if floor is None else ys + [floor]), max(ys)
+    span_y = (hi - lo) or 1
+    return [
+        (PAD + (max(x, start) - start).days / span_x * (WIDTH - 2 * PAD), HEIGHT - PAD - (y - lo) / span_y * (HEIGHT - 2 * PAD))
+        for x, y in points
+    ], lo, hi
+
+
+def _frame(title, body, lo_label, hi_label, start, end):
+    return format_html(
+        '<svg xmlns="http://www.w3.org/2000/svg" width="{w}" height="{h}" font-size="10" role="img" aria-label="{t}">'
+        '<text x="{p}" y="12">{t}</text>'
+        '<line x1="{p}" y1="{b}" x2="{r}" y2="{b}" stroke="#999"/>'
+        '<text x="0" y="{b}">{lo}</text><text x="0" y="{p}">{hi}</text>'
+        '<text x="{p}" y="{h}">{s}</text><text x="{e}" y="{h}">{end}</text>{body}</svg>',
+        w=WIDTH, h=HEIGHT, t=title, p=PAD, b=HEIGHT - PAD, r=WIDTH - PAD, lo=lo_label, hi=hi_label,
+        s=start.isoformat(), e=WIDTH - PAD - 55, end=end.isoformat(), body=body,
+    )
+
+
+def render_line_chart(title, points, start, end, fmt=lambda v: f"{v:.0f}"):
+    if not points:
+        return _frame(title, "", "", "", start, end)
+    scaled, lo, hi = _scale(points, start, end)
+    path = " ".join(f"{x:.1f},{y:.1f}" for x, y in scaled)
+    body = format_html('<polyline points="{}" fill="none" stroke="#239a3b" stroke-width="1.5"/>', path)
+    return _frame(title, body, fmt(lo), fmt(hi), start, end)
+
+
+def render_bar_chart(title, points, start, end, fmt=lambda v: f"{v:.0f}"):
+    if not points:
+        return _frame(title, "", "", "", start, end)
+    scaled, lo, hi = _scale(points, start, end, floor=0)
+    width = max((WIDTH - 2 * PAD) / (len(points) + 1) - 1, 1)
+    bars = mark_safe("".join(
+        format_html('<rect x="{}" y="{}" width="{}" height="{}" fill="#7bc96f"/>', *(f"{v:.1f}" for v in (x, y, width, HEIGHT - PAD - y)))
+        for x, y in scaled
+    ))
+    return _frame(title, bars, fmt(lo), fmt(hi), start, end)
+
+
+def _pace_label(seconds):
+    return f"{int(seconds) // 60}:{int(seconds) % 60:02d}"
+
+
+def _build(user_id, start, end):
+    kind = bucket_for_range(start, end)
+    volume, pace = bucketed_volume_and_pace(user_id, start, end, kind)
+    return {
+        "bucket": kind,
+        "volume_svg": render_bar_chart(f"Distance per {kind} (km)", volume, start, end),
+        "pace_svg": render_line_chart(f"Pace, rolling {ROLLING_BUCKETS}-{kind} average (min/km)", rolling_mean(pace), start, end, _pace_label),
+        "hr_svg": render_line_chart("Heart rate (bpm)", heart_rate_series(user_id, start, end), start, end),
+    }
+
+
+# Trend charts for a date range, cached until the user's runs change
+def trend_charts(user_id, start, end):
+    key = f"charts:{user_id}:{start.isoformat()}:{end.isoformat()}:{get_version(user_id, 'runs')}"
+    charts = cache.get(key)
+    if charts is None:
+        with primary_if_pinned(user_id):
+            charts = _build(user_id, start, end)
+        cache.set(key, charts, CHART_CACHE_SECONDS)
+    return charts
+
+
+# Default range is the last year
+def default_range():
+    end = _date.today()
+    return end - timedelta(days=364), end
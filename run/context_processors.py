@@ -0,0 +1,10 @@
+from django.utils.functional import SimpleLazyObject
+from .goals import current_progress
+
+
+# Goal progress for the nav bar, queried only when a template uses it
+def goals(request):
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        return {}
+    return {"goal_progress": SimpleLazyObject(lambda: current_progress(user.pk))}
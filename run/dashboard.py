@@ -0,0 +1,113 @@
+import asyncio
+from datetime import date as _date, timedelta
+from django.db.models import Count, F, Q, Sum
+from .models import Run, PlannedRun, pace_seconds_expression
+
+
+# latest logged runs
+def _recent_runs_qs(user_id):
+    qs = Run.objects.filter(user_id=user_id).order_by("-date", "-id")
+    return qs.values("id", "date", "run_type", "distance_km", "pace_min_km")[:5]
+
+
+# planned runs of the current Monday-Sunday week
+def _week_plan_qs(user_id):
+    monday = _date.today() - timedelta(days=_date.today().weekday())
+    qs = PlannedRun.objects.filter(user_id=user_id, date__gte=monday, date__lte=monday + timedelta(days=6))
+    return qs.order_by("date").values("date", "run_type", "distance_km", "pace_target", plan_name=F("plan__name"))
+
+
+# distance and run count for this week, month and year in one aggregate
+def _volume_query(user_id):
+    today = _date.today()
+    week_start = today - timedelta(days=today.weekday())
+    month_start = today.replace(day=1)
+    year_start = today.replace(month=1, day=1)
+    qs = Run.objects.filter(user_id=user_id, date__gte=min(week_start, year_start), date__lte=today)
+    return qs, {
+        "week_km": Sum("distance_km", filter=Q(date__gte=week_start)),
+        "week_runs": Count("id", filter=Q(date__gte=week_start)),
+        "month_km": Sum("distance_km", filter=Q(date__gte=month_start)),
+        "month_runs": Count("id", filter=Q(date__gte=month_start)),
+        "year_km": Sum("distance_km", filter=Q(date__gte=year_start)),
+        "year_runs": Count("id", filter=Q(date__gte=year_start)),
+    }
+
+
+# longest run and fastest run of 5 km or more
+def _record_qs(user_id):
+    qs = Run.objects.filter(user_id=user_id)
+    longest = qs.order_by("-distance_km", "date").values("date", "distance_km")
+    fastest = (
+        qs.filter(distance_km__gte=5)
+        .annotate(pace_s=pace_seconds_expression())
+        .order_by("pace_s", "date")
+        .values("date", "distance_km", "pace_min_km")
+    )
+    return longest, fastest
+
+
+def recent_runs(user_id):
+    return list(_recent_runs_qs(user_id))
+
+
+def week_plan(user_id):
+    return list(_week_plan_qs(user_id))
+
+
+def volume_totals(user_id):
+    qs, aggregates = _volume_query(user_id)
+    return {k: v or 0 for k, v in qs.aggregate(**aggregates).items()}
+
+
+def personal_records(user_id):
+    longest, fastest = _record_qs(user_id)
+    return {"longest": longest.first(), "fastest": fastest.first()}
+
+
+async def arecent_runs(user_id):
+    return [row async for row in _recent_runs_qs(user_id)]
+
+
+async def aweek_plan(user_id):
+    return [row async for row in _week_plan_qs(user_id)]
+
+
+async def avolume_totals(user_id):
+    qs, aggregates = _volume_query(user_id)
+    return {k: v or 0 for k, v in (await qs.aaggregate(**aggregates)).items()}
+
+
+async def apersonal_records(user_id):
+    longest, fastest = _record_qs(user_id)
+    return {"longest": await longest.afirst(), "fastest": await fastest.afirst()}
+
+
+DASHBOARD_QUERIES = {
+    "recent_runs": recent_runs,
+    "week_plan": week_plan,
+    "volume": volume_totals,
+    "prs": personal_records,
+}
+
+ASYNC_DASHBOARD_QUERIES = {
+    "recent_runs": arecent_runs,
+    "week_plan": aweek_plan,
+    "volume": avolume_totals,
+    "prs": apersonal_records,
+}
+
+
+# one after another on the calling thread
+def load_dashboard(user_id):
+    return {name: query(user_id) for name, query in DASHBOARD_QUERIES.items()}
+
+
+# The async ORM: the queries share the request's one database connection on
+# Django's thread-sensitive executor, so a request never holds more than one
+# connection however many panels the dashboard gets. The database work is
+# serialised; the event loop stays free for other requests meanwhile.
+async def aload_dashboard(user_id):
+    names = list(ASYNC_DASHBOARD_QUERIES)
+    results = await asyncio.gather(*(ASYNC_DASHBOARD_QUERIES[name](user_id) for name in names))
+    return dict(zip(names, results))
@@ -1,22 +1,53 @@
 from django import forms
 from django.forms import inlineformset_factory
-from .models import Run, validate_mm_ss, Profile, TrainingPlan, PlannedRun, HeartRateZone
+from .models import Run, validate_mm_ss, Profile, TrainingPlan, PlannedRun, HeartRateZone, Goal, Tag, Club
+from .laps import parse_laps
+from .zone_time import parse_hr_stream
 
 
 # form for creating and editing runs
 class RunForm(forms.ModelForm):
     pace_min_km = forms.CharField(max_length=5, help_text="mm:ss (e.g. 5:30)")
+    laps = forms.CharField(
+        required=False,
+        widget=forms.Textarea(attrs={"rows": 4}),
+        help_text="Optional laps, one per line: distance time [hr], e.g. 1.0 4:05 168",
+    )
 
     class Meta:
         model = Run
-        fields = ["date", "run_type", "distance_km", "pace_min_km", "heart_rate", "zone", "notes", "tags"]
-        
+        fields = ["date", "start_time", "run_type", "distance_km", "pace_min_km", "heart_rate", "zone", "notes", "tags"]
+
+    # tags are validated against all of the user's tags but only the selected ones
+    # are rendered, the rest come from the autocomplete endpoint
+    def __init__(self, *args, **kwargs):
+        user = kwargs.pop("user", None)
+        super().__init__(*args, **kwargs)
+        self.user = user
+        tags = self.fields["tags"]
+        tags.queryset = Tag.objects.filter(user=user) if user is not None else Tag.objects.none()
+        tags.help_text = "Start typing to find or create a tag"
+        tags.widget.attrs["data-autocomplete"] = "tags"
+        if self.is_bound:
+            selected = self.data.getlist(self.add_prefix("tags")) if hasattr(self.data, "getlist") else self.data.get(self.add_prefix("tags"), [])
+        else:
+            selected = [getattr(t, "pk", t) for t in self.initial.get("tags") or []]
+        selected = [pk for pk in selected if str(pk).isdigit()]
+        tags.widget.choices = list(tags.queryset.filter(pk__in=selected).values_list("pk", "name")) if selected else []
+
     # validate pace_min_km field
     def clean_pace_min_km(self):
         value = self.cleaned_data["pace_min_km"]
         validate_mm_ss(value)
         return value
 
+    # parse laps into dicts for bulk insert
+    def clean_laps(self):
+        try:
+            return parse_laps(self.cleaned_data.get("laps"))
+        except ValueError as exc:
+            raise forms.ValidationError(str(exc))
+
 # simple profile form
 class ProfileForm(forms.ModelForm):
     class Meta:
@@ -70,3 +101,42 @@ class TrainingPlanForm(forms.ModelForm):
         fields = ["name", "description", "start_date"]
 
 
+# CSV upload of runs
+class RunImportForm(forms.Form):
+    file = forms.FileField(help_text="CSV with columns: date, run_type, distance_km, pace_min_km, heart_rate, zone, notes, start_time")
+
+    def clean_file(self):
+        try:
+            return self.cleaned_data["file"].read().decode("utf-8-sig")
+        except UnicodeDecodeError:
+            raise forms.ValidationError("The file must be UTF-8 encoded CSV")
+
+
+# per-second heart rate recorded during a run, used for time in zone
+class HeartRateStreamForm(forms.Form):
+    file = forms.FileField(help_text="One heart rate per second, one per line, or a CSV with a heart_rate column")
+
+    def clean_file(self):
+        try:
+            return parse_hr_stream(self.cleaned_data["file"].read().decode("utf-8-sig"))
+        except UnicodeDecodeError:
+            raise forms.ValidationError("The file must be UTF-8 encoded text")
+        except ValueError as exc:
+            raise forms.ValidationError(str(exc))
+
+
+# weekly or monthly goal; setting the same metric and period again replaces the target
+class GoalForm(forms.ModelForm):
+    class Meta:
+        model = Goal
+        fields = ["metric", "period", "target"]
+
+    def validate_unique(self):
+        pass
+
+
+# new club, the creator becomes its first member
+class ClubForm(forms.ModelForm):
+    class Meta:
+        model = Club
+        fields = ["name"]
@@ -0,0 +1,32 @@
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from .models import Run
+
+
+ROW_CACHE_SECONDS = 60 * 60 * 24 * 7
+
+
+# updated_at moves on every edit and tag change, so it versions the fragment
+def row_key(run_id, updated_at) -> str:
+    return f"run-row:{run_id}:{updated_at.timestamp():.6f}"
+
+
+# Rendered <li> rows for (id, updated_at) pairs, in order, with one cache multi-get
+def render_run_rows(versions):
+    keys = [row_key(run_id, updated_at) for run_id, updated_at in versions]
+    cached = cache.get_many(keys)
+    missing = [run_id for (run_id, _), key in zip(versions, keys) if key not in cached]
+    fresh = {}
+    if missing:
+        # keyed by id: a run edited since the first query is rendered at its current version
+        for run in Run.objects.filter(pk__in=missing).prefetch_related("tags"):
+            fresh[run.pk] = (row_key(run.pk, run.updated_at), render_to_string("run/_run_row.html", {"r": run}))
+        cache.set_many(dict(fresh.values()), ROW_CACHE_SECONDS)
+    rows = []
+    for (run_id, _), key in zip(versions, keys):
+        if key in cached:
+            rows.append(mark_safe(cached[key]))
+        elif run_id in fresh:
+            rows.append(mark_safe(fresh[run_id][1]))
+    return rows
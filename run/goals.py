@@ -0,0 +1,154 @@
+from collections import defaultdict
+from datetime import date as _date, timedelta
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+from .models import Goal, PeriodTotal, Run
+
+
+PERIODS = ("week", "month")
+STREAK_PAGE = 53
+
+
+def period_start(period, day):
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def previous_period_start(period, start):
+    if period == "week":
+        return start - timedelta(days=7)
+    return (start - timedelta(days=1)).replace(day=1)
+
+
+# {(period, start): [km, runs]} contributions of runs given as (date, distance_km)
+def run_deltas(runs, sign=1):
+    deltas = defaultdict(lambda: [0.0, 0])
+    for day, km in runs:
+        for period in PERIODS:
+            delta = deltas[(period, period_start(period, day))]
+            delta[0] += sign * float(km)
+            delta[1] += sign
+    return deltas
+
+
+# Apply deltas atomically with F() so concurrent writers never lose an update
+def apply_deltas(user_id, deltas):
+    for (period, start), (km, runs) in deltas.items():
+        if not km and not runs:
+            continue
+        lookup = {"user_id": user_id, "period": period, "period_start": start}
+        if PeriodTotal.objects.filter(**lookup).update(distance_km=F("distance_km") + km, runs=F("runs") + runs):
+            continue
+        try:
+            with transaction.atomic():
+                PeriodTotal.objects.create(distance_km=km, runs=runs, **lookup)
+        except IntegrityError:
+            # created concurrently by another writer
+            PeriodTotal.objects.filter(**lookup).update(distance_km=F("distance_km") + km, runs=F("runs") + runs)
+
+
+# Counter changes for a saved run; the stored values come from Run.from_db
+def on_run_saved(run, created):
+    deltas = run_deltas([(run.date, run.distance_km)])
+    loaded = getattr(run, "_loaded_values", None)
+    if not created:
+        if not loaded or "date" not in loaded or "distance_km" not in loaded:
+            return  # unknown previous state, left to reconcile_goals
+        if loaded["date"] == run.date and float(loaded["distance_km"]) == float(run.distance_km):
+            return
+        for key, (km, runs) in run_deltas([(loaded["date"], loaded["distance_km"])], sign=-1).items():
+            deltas[key][0] += km
+            deltas[key][1] += runs
+    apply_deltas(run.user_id, deltas)
+
+
+def on_run_deleted(run):
+    loaded = getattr(run, "_loaded_values", None) or {}
+    apply_deltas(run.user_id, run_deltas([(loaded.get("date", run.date), loaded.get("distance_km", run.distance_km))], sign=-1))
+
+
+# Recompute all totals of a user from Run and fix whatever drifted; returns rows fixed
+def reconcile_user(user_id):
+    actual = {}
+    runs = Run.objects.filter(user_id=user_id)
+    for period, trunc in (("week", TruncWeek("date")), ("month", TruncMonth("date"))):
+        rows = runs.annotate(start=trunc).values("start").annotate(km=Sum("distance_km"), n=Count("id")).order_by()
+        for row in rows:
+            start = row["start"].date() if hasattr(row["start"], "date") else row["start"]
+            actual[(period, start)] = (row["km"], row["n"])
+
+    fixed = 0
+    with transaction.atomic():
+        stored = {(t.period, t.period_start): t for t in PeriodTotal.objects.select_for_update().filter(user_id=user_id)}
+        for key, total in stored.items():
+            if key not in actual:
+                total.delete()
+                fixed += 1
+        for (period, start), (km, n) in actual.items():
+            total = stored.get((period, start))
+            if total is None:
+                PeriodTotal.objects.create(user_id=user_id, period=period, period_start=start, distance_km=km, runs=n)
+                fixed += 1
+            elif abs(total.distance_km - km) > 1e-6 or total.runs != n:
+                total.distance_km, total.runs = km, n
+                total.save(update_fields=["distance_km", "runs"])
+                fixed += 1
+    return fixed
+
+
+def _metric_value(total, metric):
+    return total["distance_km"] if metric == "distance" else total["runs"]
+
+
+# Consecutive finished-or-current periods meeting the goal, read newest first
+# in small pages until the first miss, so it never scans the full history
+def goal_streak(goal, today=None):
+    today = today or _date.today()
+    expected = period_start(goal.period, today)
+    qs = PeriodTotal.objects.filter(user_id=goal.user_id, period=goal.period, period_start__lte=expected).order_by("-period_start")
+    # the current period is still in progress, missing it does not break the streak
+    current = expected
+    streak, offset = 0, 0
+    while True:
+        page = list(qs.values("period_start", "distance_km", "runs")[offset:offset + STREAK_PAGE])
+        for total in page:
+            if total["period_start"] < expected:
+                if expected != current:
+                    return streak  # a period without any runs
+                expected = previous_period_start(goal.period, expected)
+                if total["period_start"] < expected:
+                    return streak
+            if _metric_value(total, goal.metric) >= goal.target:
+                streak += 1
+            elif expected != current:
+                return streak
+            expected = previous_period_start(goal.period, expected)
+        if len(page) < STREAK_PAGE:
+            return streak
+        offset += STREAK_PAGE
+
+
+# Goals with their current-period progress, two queries in total
+def current_progress(user_id, today=None):
+    today = today or _date.today()
+    goals = list(Goal.objects.filter(user_id=user_id))
+    if not goals:
+        return []
+    starts = {period: period_start(period, today) for period in PERIODS}
+    totals = {
+        (t["period"], t["period_start"]): t
+        for t in PeriodTotal.objects.filter(user_id=user_id, period_start__in=set(starts.values()))
+        .values("period", "period_start", "distance_km", "runs")
+    }
+    progress = []
+    for goal in goals:
+        total = totals.get((goal.period, starts[goal.period]))
+        value = _metric_value(total, goal.metric) if total else 0
+        progress.append({
+            "goal": goal,
+            "value": round(value, 1),
+            "percent": min(100, round(100 * value / goal.target)),
+        })
+    return progress
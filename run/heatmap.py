@@ -0,0 +1,101 @@
+import math
+from collections import defaultdict
+from datetime import date as _date, timedelta
+from django.core.cache import cache
+from django.db.models import Count, Sum
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+from .models import Run, RUN_TYPE_CHOICES
+from .routers import primary_if_pinned
+from .versioning import get_version
+
+
+CELL = 11
+GAP = 2
+TOP = 15
+LEFT = 28
+COLORS = ["#ebedf0", "#c6e48b", "#7bc96f", "#239a3b", "#196127"]
+PAST_YEAR_CACHE_SECONDS = 60 * 60 * 24 * 30
+
+
+# Distance per day and totals per run type, from one GROUP BY over (user, date)
+def year_activity(user_id, year):
+    rows = (
+        Run.objects.filter(user_id=user_id, date__gte=_date(year, 1, 1), date__lte=_date(year, 12, 31))
+        .values("date", "run_type")
+        .annotate(km=Sum("distance_km"), runs=Count("id"))
+        .order_by()
+    )
+    per_day = defaultdict(float)
+    per_type = {}
+    for row in rows:
+        per_day[row["date"]] += row["km"]
+        totals = per_type.setdefault(row["run_type"], {"km": 0.0, "runs": 0})
+        totals["km"] += row["km"]
+        totals["runs"] += row["runs"]
+    return dict(per_day), per_type
+
+
+def _level(km, peak):
+    if not km:
+        return 0
+    return min(4, max(1, math.ceil(4 * km / peak)))
+
+
+# GitHub-style calendar of one year as inline SVG, weeks in columns from Monday
+def render_heatmap_svg(year, per_day) -> str:
+    first, last = _date(year, 1, 1), _date(year, 12, 31)
+    grid_start = first - timedelta(days=first.weekday())
+    peak = max(per_day.values(), default=0)
+    step = CELL + GAP
+
+    cells, labels = [], []
+    # counted up to Dec 31, stepping past it would overflow in year 9999
+    for offset in range((last - first).days + 1):
+        day = first + timedelta(days=offset)
+        col = (day - grid_start).days // 7
+        row = day.weekday()
+        km = per_day.get(day, 0)
+        cells.append(format_html(
+            '<rect x="{}" y="{}" width="{}" height="{}" fill="{}"><title>{}: {} km</title></rect>',
+            LEFT + col * step, TOP + row * step, CELL, CELL, COLORS[_level(km, peak)], day.isoformat(), round(km, 1),
+        ))
+        if day.day == 1:
+            labels.append(format_html('<text x="{}" y="10">{}</text>', LEFT + col * step, day.strftime("%b")))
+
+    weeks = (last - grid_start).days // 7 + 1
+    weekdays = [format_html('<text x="0" y="{}">{}</text>', TOP + row * step + CELL - 1, name)
+                for row, name in ((0, "Mon"), (2, "Wed"), (4, "Fri"))]
+    return format_html(
+        '<svg xmlns="http://www.w3.org/2000/svg" width="{}" height="{}" font-size="9" role="img" aria-label="Runs in {}">{}</svg>',
+        LEFT + weeks * step, TOP + 7 * step, year, mark_safe("".join(labels + weekdays + cells)),
+    )
+
+
+def _build(user_id, year):
+    per_day, per_type = year_activity(user_id, year)
+    labels = dict(RUN_TYPE_CHOICES)
+    type_totals = sorted(
+        ({"run_type": labels.get(t, t), "km": round(v["km"], 1), "runs": v["runs"]} for t, v in per_type.items()),
+        key=lambda item: -item["km"],
+    )
+    return {
+        "svg": render_heatmap_svg(year, per_day),
+        "type_totals": type_totals,
+        "total_km": round(sum(v["km"] for v in per_type.values()), 1),
+        "total_runs": sum(v["runs"] for v in per_type.values()),
+        "active_days": len(per_day),
+    }
+
+
+# Year in review; finished years are cached until one of their runs changes
+def year_in_review(user_id, year):
+    if year >= _date.today().year:
+        return _build(user_id, year)
+    key = f"heatmap:{user_id}:{year}:{get_version(user_id, f'runs:{year}')}"
+    review = cache.get(key)
+    if review is None:
+        with primary_if_pinned(user_id):
+            review = _build(user_id, year)
+        cache.set(key, review, PAST_YEAR_CACHE_SECONDS)
+    return review
@@ -0,0 +1,115 @@
+from datetime import date as _date, datetime, time as _time, timedelta, timezone as dt_timezone
+from django.core import signing
+from django.db.models import F
+from .models import PlannedRun, RUN_TYPE_CHOICES
+from .versioning import get_version
+
+
+FEED_SALT = "run.ics"
+FEED_DAYS_BACK = 30
+FEED_DAYS_AHEAD = 365
+
+
+# Token that identifies a user's feed without a login
+def feed_token(user_id) -> str:
+    return signing.Signer(salt=FEED_SALT).sign(str(user_id))
+
+
+def user_id_from_token(token):
+    try:
+        return int(signing.Signer(salt=FEED_SALT).unsign(token))
+    except (signing.BadSignature, ValueError):
+        return None
+
+
+def feed_version(user_id) -> int:
+    return get_version(user_id, "planned")
+
+
+# The feed is a window around today, so it changes with the day as well as the plans
+def feed_etag(user_id, today=None) -> str:
+    today = today or _date.today()
+    return f"{feed_version(user_id)}-{today.isoformat()}"
+
+
+def feed_last_modified(user_id, today=None) -> datetime:
+    today = today or _date.today()
+    changed = datetime.fromtimestamp(feed_version(user_id) / 1_000_000, tz=dt_timezone.utc)
+    midnight = datetime.combine(today, _time.min).astimezone(dt_timezone.utc)
+    return max(changed, midnight)
+
+
+# RFC 5545 text escaping
+def escape_text(value) -> str:
+    return (
+        str(value).replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+        .replace("\r\n", "\\n").replace("\n", "\\n")
+    )
+
+
+# Fold content lines longer than 75 octets
+def fold(line: str) -> str:
+    raw = line.encode("utf-8")
+    if len(raw) <= 75:
+        return line + "\r\n"
+    parts, start, limit = [], 0, 75
+    while start < len(raw):
+        end = min(start + limit, len(raw))
+        # do not cut inside a multi-byte character
+        while end < len(raw) and (raw[end] & 0xC0) == 0x80:
+            end -= 1
+        parts.append(raw[start:end].decode("utf-8"))
+        start, limit = end, 74
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def _event(item, stamp):
+    labels = dict(RUN_TYPE_CHOICES)
+    summary = labels.get(item["run_type"], item["run_type"])
+    if item["distance_km"]:
+        summary += f" {item['distance_km']:g} km"
+    details = []
+    if item["pace_target"]:
+        details.append(f"Target pace {item['pace_target']} /km")
+    if item["plan_name"]:
+        details.append(f"Plan: {item['plan_name']}")
+    if item["notes"]:
+        details.append(item["notes"])
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:planned-run-{item['id']}@pacepower",
+        f"DTSTAMP:{stamp}",
+        f"LAST-MODIFIED:{item['updated_at'].astimezone(dt_timezone.utc):%Y%m%dT%H%M%SZ}",
+        f"DTSTART;VALUE=DATE:{item['date']:%Y%m%d}",
+        f"DTEND;VALUE=DATE:{item['date'] + timedelta(days=1):%Y%m%d}",
+        f"SUMMARY:{escape_text(summary)}",
+    ]
+    if details:
+        lines.append(f"DESCRIPTION:{escape_text(chr(10).join(details))}")
+    lines.append("END:VEVENT")
+    return "".join(fold(line) for line in lines)
+
+
+# Calendar lines for the user's planned runs in a bounded window, read in chunks
+def generate_feed(user_id, today=None):
+    today = today or _date.today()
+    stamp = f"{datetime.now(dt_timezone.utc):%Y%m%dT%H%M%SZ}"
+    yield "".join(fold(line) for line in [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//PacePower//Planned runs//EN",
+        "CALSCALE:GREGORIAN",
+        "X-WR-CALNAME:PacePower planned runs",
+    ])
+    items = (
+        PlannedRun.objects.filter(
+            user_id=user_id,
+            date__gte=today - timedelta(days=FEED_DAYS_BACK),
+            date__lte=today + timedelta(days=FEED_DAYS_AHEAD),
+        )
+        .order_by("date", "id")
+        .values("id", "date", "run_type", "distance_km", "pace_target", "notes", "updated_at", plan_name=F("plan__name"))
+    )
+    for item in items.iterator(chunk_size=500):
+        yield _event(item, stamp)
+    yield fold("END:VCALENDAR")
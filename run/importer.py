@@ -0,0 +1,128 @@
+import csv
+import io
+import math
+from dataclasses import dataclass, field
+from datetime import date as _date, time as _time
+from django.db import connection
+from .goals import apply_deltas, run_deltas
+from .models import Run, RUN_TYPE_CHOICES, run_fingerprint, validate_mm_ss
+from .versioning import bump_version
+from .zone_time import enqueue_zone_weeks
+
+
+BATCH_SIZE = 1000
+CSV_COLUMNS = ["date", "run_type", "distance_km", "pace_min_km", "heart_rate", "zone", "notes", "start_time"]
+RUN_TYPES = {code for code, _ in RUN_TYPE_CHOICES}
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    skipped: int = 0
+    invalid: int = 0
+    errors: list = field(default_factory=list)
+
+    def as_dict(self):
+        return {"created": self.created, "skipped": self.skipped, "invalid": self.invalid, "errors": self.errors[:20]}
+
+
+# One CSV row as an unsaved Run with its fingerprint; ValueError if unusable
+def run_from_row(user_id, row) -> Run:
+    run_date = _date.fromisoformat((row.get("date") or "").strip())
+    run_type = (row.get("run_type") or "RUN").strip().upper()
+    if run_type not in RUN_TYPES:
+        raise ValueError(f"unknown run_type {run_type!r}")
+    distance = float((row.get("distance_km") or "").replace(",", "."))
+    if not math.isfinite(distance) or distance < 0.01:
+        raise ValueError("distance_km must be a number of at least 0.01")
+    pace = (row.get("pace_min_km") or "").strip()
+    validate_mm_ss(pace)
+    start = (row.get("start_time") or "").strip()
+    start_time = _time.fromisoformat(start) if start else None
+    return Run(
+        user_id=user_id,
+        date=run_date,
+        run_type=run_type,
+        distance_km=distance,
+        pace_min_km=pace,
+        heart_rate=(row.get("heart_rate") or "").strip()[:20],
+        zone=(row.get("zone") or "").strip()[:10],
+        notes=(row.get("notes") or "").strip(),
+        start_time=start_time,
+        fingerprint=run_fingerprint(user_id, run_date, distance, pace, start_time),
+        imported=True,
+    )
+
+
+def _insert_new(runs):
+    # INSERT ... ON CONFLICT DO NOTHING RETURNING, so rows a concurrent import
+    # inserted first come back missing instead of being counted as created
+    fields = [f for f in Run._meta.concrete_fields if not f.primary_key]
+    qn = connection.ops.quote_name
+    row_sql = "(" + ", ".join(["%s"] * len(fields)) + ")"
+    params = [
+        f.get_db_prep_save(f.pre_save(run, add=True), connection)
+        for run in runs
+        for f in fields
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {qn(Run._meta.db_table)} ({', '.join(qn(f.column) for f in fields)}) "
+            f"VALUES {', '.join([row_sql] * len(runs))} "
+            "ON CONFLICT DO NOTHING RETURNING id, date, distance_km",
+            params,
+        )
+        return cursor.fetchall()
+
+
+def _flush(user_id, batch, result, dates):
+    # one lookup per batch for rows we already have; the date range lets it use
+    # the whole (user, date, fingerprint) index
+    batch_dates = [run.date for run in batch.values()]
+    existing = set(
+        Run.objects.filter(
+            user_id=user_id, date__range=(min(batch_dates), max(batch_dates)), fingerprint__in=list(batch)
+        ).values_list("fingerprint", flat=True)
+    )
+    fresh = [run for fp, run in batch.items() if fp not in existing]
+    inserted = _insert_new(fresh) if fresh else []
+    result.created += len(inserted)
+    result.skipped += len(batch) - len(inserted)
+    dates.update(run_date for _, run_date, _ in inserted)
+    apply_deltas(user_id, run_deltas((run_date, distance) for _, run_date, distance in inserted))
+
+
+# Import runs from dict rows, skipping rows whose fingerprint is already stored
+def import_runs(user_id, rows, progress=None) -> ImportResult:
+    result = ImportResult()
+    batch, dates = {}, set()
+    lineno = 1
+    for lineno, row in enumerate(rows, start=2):
+        try:
+            run = run_from_row(user_id, row)
+        except (ValueError, TypeError) as exc:
+            result.invalid += 1
+            result.errors.append(f"Line {lineno}: {exc}")
+            continue
+        if run.fingerprint in batch:
+            result.skipped += 1
+            continue
+        batch[run.fingerprint] = run
+        if len(batch) >= BATCH_SIZE:
+            _flush(user_id, batch, result, dates)
+            batch = {}
+            if progress:
+                progress(lineno - 1)
+    if batch:
+        _flush(user_id, batch, result, dates)
+    if progress:
+        progress(lineno - 1)
+    # bulk inserts send no signals
+    if dates:
+        bump_version(user_id, "runs", *(f"runs:{y}" for y in sorted({d.year for d in dates})))
+        enqueue_zone_weeks(user_id, dates)
+    return result
+
+
+def import_runs_csv(user_id, text: str, progress=None) -> ImportResult:
+    return import_runs(user_id, csv.DictReader(io.StringIO(text)), progress)
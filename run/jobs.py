@@ -0,0 +1,117 @@
+import logging
+import traceback
+from datetime import timedelta
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from .models import Job
+
+
+logger = logging.getLogger(__name__)
+
+JOB_HANDLERS = {}
+RETRY_BASE_SECONDS = 30
+STALE_AFTER = timedelta(minutes=15)
+# done and failed jobs are kept this long for the status endpoint and the admin
+FINISHED_RETENTION = timedelta(days=7)
+
+
+# Register a function(job) as the handler for a job kind; what it returns is kept
+# as the job's result, the rest of the payload is dropped once the job is done
+def job_handler(kind):
+    def register(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return register
+
+
+# Queue a job for a user or user id; an identical job that is still waiting is reused instead
+def enqueue(user, kind, payload=None, dedup_key="", max_attempts=3):
+    user_id = getattr(user, "pk", user)
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                return Job.objects.create(
+                    user_id=user_id, kind=kind, payload=payload or {}, dedup_key=dedup_key, max_attempts=max_attempts,
+                )
+        except IntegrityError:
+            existing = Job.objects.filter(user_id=user_id, kind=kind, dedup_key=dedup_key, status="queued").first()
+            # the waiting job may have been claimed in the meantime, then try again
+            if existing is not None:
+                return existing
+    raise RuntimeError(f"Could not enqueue {kind} job")
+
+
+# Store progress of a running job, which also serves as its heartbeat
+def report_progress(job, done, total=None):
+    job.progress = done
+    fields = {"progress": done, "updated_at": timezone.now()}
+    if total is not None:
+        job.progress_total = total
+        fields["progress_total"] = total
+    Job.objects.filter(pk=job.pk).update(**fields)
+
+
+# Take the oldest due job; concurrent workers skip rows locked by each other
+def claim_next_job():
+    with transaction.atomic():
+        job = (
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status="queued", run_after__lte=timezone.now())
+            .order_by("run_after", "id")
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = "running"
+        job.attempts += 1
+        job.save(update_fields=["status", "attempts", "updated_at"])
+    return job
+
+
+def _finish(job, **fields):
+    try:
+        with transaction.atomic():
+            Job.objects.filter(pk=job.pk).update(updated_at=timezone.now(), **fields)
+    except IntegrityError:
+        # a retry collided with a newer identical job waiting in the queue
+        Job.objects.filter(pk=job.pk).update(status="failed", error="Superseded by a newer queued job", updated_at=timezone.now())
+
+
+# Run one claimed job and record the outcome, scheduling a retry with backoff on error
+def run_job(job):
+    handler = JOB_HANDLERS.get(job.kind)
+    try:
+        if handler is None:
+            raise LookupError(f"No handler for job kind {job.kind!r}")
+        result = handler(job)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning("Job %s failed (attempt %s/%s)", job.pk, job.attempts, job.max_attempts)
+        if job.attempts < job.max_attempts and handler is not None:
+            delay = timedelta(seconds=RETRY_BASE_SECONDS * 2 ** (job.attempts - 1))
+            _finish(job, status="queued", error=error, run_after=timezone.now() + delay)
+        else:
+            _finish(job, status="failed", error=error)
+        return False
+    _finish(job, status="done", error="", payload={} if result is None else {"result": result})
+    return True
+
+
+# Requeue jobs whose worker stopped reporting, e.g. after a crash
+def requeue_stale_jobs():
+    cutoff = timezone.now() - STALE_AFTER
+    count = 0
+    for job in Job.objects.filter(status="running", updated_at__lt=cutoff):
+        if job.attempts < job.max_attempts:
+            _finish(job, status="queued", error="Worker stopped responding")
+        else:
+            _finish(job, status="failed", error="Worker stopped responding")
+        count += 1
+    return count
+
+
+# Delete done and failed jobs older than FINISHED_RETENTION; returns how many went
+def purge_finished_jobs(now=None):
+    cutoff = (now or timezone.now()) - FINISHED_RETENTION
+    deleted, _ = Job.objects.filter(status__in=("done", "failed"), updated_at__lt=cutoff).delete()
+    return deleted
@@ -0,0 +1,98 @@
+import re
+from django.db.models import ExpressionWrapper, F, FloatField
+from .models import Lap
+
+
+LAP_LINE = re.compile(r"^(\d+(?:[.,]\d+)?)\s*(?:km)?\s+(\d{1,2}(?::\d{2}){1,2})(?:\s+(\d{2,3}))?$")
+REP_KM = 1.0
+REP_TOLERANCE_KM = 0.05
+
+
+# 'm:ss' or 'h:mm:ss' as seconds
+def parse_duration(text: str) -> int:
+    seconds = 0
+    for part in text.split(":"):
+        seconds = seconds * 60 + int(part)
+    return seconds
+
+
+def format_duration(seconds) -> str:
+    seconds = int(round(seconds))
+    h, rest = divmod(seconds, 3600)
+    m, s = divmod(rest, 60)
+    return f"{h}:{m:02d}:{s:02d}" if h else f"{m}:{s:02d}"
+
+
+# Laps typed one per line as 'distance time [hr]', e.g. '1.0 4:05 168'
+def parse_laps(text: str):
+    laps = []
+    for lineno, line in enumerate((text or "").splitlines(), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        match = LAP_LINE.match(line)
+        if not match:
+            raise ValueError(f"Line {lineno}: use 'distance time [hr]', e.g. '1.0 4:05 168'")
+        distance = float(match.group(1).replace(",", "."))
+        duration = parse_duration(match.group(2))
+        if distance <= 0 or duration <= 0:
+            raise ValueError(f"Line {lineno}: distance and time must be positive")
+        hr = int(match.group(3)) if match.group(3) else None
+        laps.append({"distance_km": distance, "duration_seconds": duration, "heart_rate": hr})
+    return laps
+
+
+# Insert all laps of a run with one statement
+def save_laps(run, laps):
+    return Lap.objects.bulk_create([
+        Lap(run=run, user_id=run.user_id, number=n, **lap) for n, lap in enumerate(laps, start=1)
+    ])
+
+
+# Split table and lap stats for one run, from a single query
+def split_table(run):
+    laps = list(run.laps.all())
+    if not laps:
+        return None
+    fastest = min(laps, key=lambda lap: lap.pace_seconds)
+    slowest = max(laps, key=lambda lap: lap.pace_seconds)
+    total_km = sum(lap.distance_km for lap in laps)
+    total_s = sum(lap.duration_seconds for lap in laps)
+    elapsed = 0
+    rows = []
+    for lap in laps:
+        elapsed += lap.duration_seconds
+        rows.append({
+            "number": lap.number,
+            "distance_km": lap.distance_km,
+            "time": format_duration(lap.duration_seconds),
+            "pace": format_duration(lap.pace_seconds),
+            "elapsed": format_duration(elapsed),
+            "heart_rate": lap.heart_rate,
+            "fastest": lap is fastest,
+        })
+    return {
+        "rows": rows,
+        "fastest": {"number": fastest.number, "pace": format_duration(fastest.pace_seconds)},
+        "slowest": {"number": slowest.number, "pace": format_duration(slowest.pace_seconds)},
+        "average_pace": format_duration(total_s / total_km),
+        "spread": format_duration(slowest.pace_seconds - fastest.pace_seconds),
+    }
+
+
+# Fastest ~1 km lap across the user's history, served by the (user, distance, duration) index
+def best_1km_rep(user_id):
+    lap = (
+        Lap.objects.filter(
+            user_id=user_id,
+            distance_km__gte=REP_KM - REP_TOLERANCE_KM,
+            distance_km__lte=REP_KM + REP_TOLERANCE_KM,
+        )
+        .annotate(pace=ExpressionWrapper(F("duration_seconds") / F("distance_km"), output_field=FloatField()))
+        .order_by("pace", "id")
+        .values("run_id", "run__date", "pace")
+        .first()
+    )
+    if lap is None:
+        return None
+    return {"run_id": lap["run_id"], "date": lap["run__date"], "time": format_duration(lap["pace"] * REP_KM)}
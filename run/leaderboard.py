@@ -0,0 +1,76 @@
+from datetime import date as _date, timedelta
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, FloatField, Func, Max, Sum, Window
+from django.db.models.functions import Rank
+from .goals import period_start
+from .models import LeaderboardSnapshot, Run
+
+
+LEADERBOARD_METRICS = {
+    "distance": "Distance",
+    "runs": "Runs",
+    "longest": "Longest run",
+}
+
+
+# SUM() OVER of a per-member aggregate, i.e. SUM(SUM(distance_km)) OVER ()
+class _WindowSum(Func):
+    function = "SUM"
+    window_compatible = True
+    output_field = FloatField()
+
+
+def period_end(period, start):
+    if period == "week":
+        return start + timedelta(days=7)
+    return (start + timedelta(days=32)).replace(day=1)
+
+
+# One query: per-member totals, a rank for every metric and the club total
+def compute_leaderboard(club_id, period, start):
+    rows = (
+        Run.objects.filter(
+            user__club_memberships__club_id=club_id,
+            date__gte=start,
+            date__lt=period_end(period, start),
+        )
+        .values("user_id", username=F("user__username"))
+        .annotate(distance=Sum("distance_km"), runs=Count("id"), longest=Max("distance_km"))
+        .annotate(
+            distance_rank=Window(Rank(), order_by=F("distance").desc()),
+            runs_rank=Window(Rank(), order_by=F("runs").desc()),
+            longest_rank=Window(Rank(), order_by=F("longest").desc()),
+            club_distance=Window(_WindowSum(Sum("distance_km"))),
+        )
+        .order_by("distance_rank", "username")
+    )
+    entries = []
+    for row in rows:
+        row["distance"] = round(row["distance"], 2)
+        row["share"] = round(100 * row["distance"] / row.pop("club_distance"), 1) if row["distance"] else 0
+        entries.append(row)
+    return entries
+
+
+# Leaderboard entries of a period; finished periods come from (or go to) a snapshot
+def leaderboard(club_id, period, start, today=None):
+    today = today or _date.today()
+    start = period_start(period, start)
+    if start >= period_start(period, today):
+        return compute_leaderboard(club_id, period, start)
+    snapshot = LeaderboardSnapshot.objects.filter(club_id=club_id, period=period, period_start=start).first()
+    if snapshot is not None:
+        return snapshot.entries
+    entries = compute_leaderboard(club_id, period, start)
+    try:
+        with transaction.atomic():
+            LeaderboardSnapshot.objects.create(club_id=club_id, period=period, period_start=start, entries=entries)
+    except IntegrityError:
+        # stored meanwhile by another request, which computed the same thing
+        pass
+    return entries
+
+
+# Entries ordered by one metric's rank
+def sort_entries(entries, metric):
+    return sorted(entries, key=lambda e: (e[f"{metric}_rank"], e["username"]))
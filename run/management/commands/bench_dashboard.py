@@ -0,0 +1,41 @@
+import asyncio
+import statistics
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from run.benchmarks import asgi_request, session_cookie, timed
+from run.dashboard import aload_dashboard, load_dashboard
+
+
+class Command(BaseCommand):
+    help = "Compare the dashboard queries through the sync and the async ORM under ASGI"
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']!r} does not exist")
+        cookie = session_cookie(user)
+        results = asyncio.run(self._bench(user.pk, cookie, options["repeat"]))
+
+        self.stdout.write(f"{'mode':<28}{'median ms':>12}{'mean ms':>12}{'max ms':>12}")
+        for mode, samples in results.items():
+            self.stdout.write(
+                f"{mode:<28}{statistics.median(samples):>12.2f}{statistics.mean(samples):>12.2f}{max(samples):>12.2f}"
+            )
+
+    async def _bench(self, user_id, cookie, repeat):
+        from PacePower.asgi import application
+
+        results = {"queries, sync ORM": [], "queries, async ORM": [], "GET /dashboard/ via ASGI": []}
+        for _ in range(repeat):
+            results["queries, sync ORM"].append(await timed(lambda: sync_to_async(load_dashboard)(user_id)))
+            results["queries, async ORM"].append(await timed(lambda: aload_dashboard(user_id)))
+            results["GET /dashboard/ via ASGI"].append(
+                await timed(lambda: asgi_request(application, "/dashboard/", headers=[("cookie", cookie)]))
+            )
+        return results
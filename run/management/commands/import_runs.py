@@ -0,0 +1,22 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from run.importer import import_runs_csv
+
+
+class Command(BaseCommand):
+    help = "Import runs for a user from a CSV file, skipping duplicates"
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("csv_path")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']!r} does not exist")
+        with open(options["csv_path"], encoding="utf-8-sig") as fh:
+            result = import_runs_csv(user.pk, fh.read())
+        for error in result.errors:
+            self.stderr.write(error)
+        self.stdout.write(f"Created {result.created}, skipped {result.skipped} duplicates, {result.invalid} invalid rows")
@@ -0,0 +1,211 @@
+import asyncio
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import date as _date, timedelta
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from run.benchmarks import (
+    TRAFFIC_MIX, SimulatedUser, asgi_request, http_request, percentile, wsgi_request,
+)
+from run.models import HeartRateZone, Profile, Run, ensure_default_zones
+
+
+USERNAME_PREFIX = "loadtest-"
+
+
+class Command(BaseCommand):
+    help = "Drive the WSGI or ASGI app (in-process) or a running server with concurrent logged-in users"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--target", default="wsgi", help="wsgi, asgi or a base URL such as http://127.0.0.1:8000")
+        parser.add_argument("--users", type=int, default=10, help="concurrent simulated users")
+        parser.add_argument("--duration", type=float, default=10.0, help="seconds of traffic")
+        parser.add_argument("--seed-runs", type=int, default=200, help="runs created for each new load-test user")
+        parser.add_argument("--mix", default="", help="weights, e.g. run_list=50,calendar=20,run_create=20,profile_edit=10")
+        parser.add_argument("--seed", type=int, default=0, help="random seed for reproducible traffic")
+        parser.add_argument("--cleanup", action="store_true", help="delete the load-test users afterwards")
+
+    def handle(self, *args, **options):
+        mix = self._parse_mix(options["mix"])
+        target = options["target"]
+        if target not in ("wsgi", "asgi") and not target.startswith("http"):
+            raise CommandError("--target must be wsgi, asgi or an http:// URL")
+        if settings.DEBUG:
+            self.stderr.write("DEBUG is on, every query is recorded; numbers will be pessimistic")
+
+        users = self._seed(options["users"], options["seed_runs"])
+        sims = [
+            SimulatedUser(user, zones, random.Random(options["seed"] + i), mix)
+            for i, (user, zones) in enumerate(users)
+        ]
+        connections.close_all()
+
+        stats = LoadStats()
+        sampler = ConnectionSampler()
+        connection_created.connect(stats.on_connection)
+        sampler.start()
+        try:
+            if target == "asgi":
+                elapsed = asyncio.run(self._run_asgi(sims, options["duration"], stats))
+            else:
+                elapsed = self._run_threads(sims, options["duration"], stats, target)
+        finally:
+            sampler.stop()
+            connection_created.disconnect(stats.on_connection)
+
+        self._report(target, len(sims), elapsed, stats, sampler)
+        if options["cleanup"]:
+            User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+
+    def _parse_mix(self, text):
+        if not text:
+            return TRAFFIC_MIX
+        mix = {}
+        for part in text.split(","):
+            name, _, weight = part.partition("=")
+            if name.strip() not in TRAFFIC_MIX or not weight.strip().isdigit():
+                raise CommandError(f"Bad mix entry {part!r}, use {','.join(f'{k}=N' for k in TRAFFIC_MIX)}")
+            mix[name.strip()] = int(weight)
+        return mix
+
+    # Users loadtest-0..N-1 with zones and some history, reused by later runs
+    def _seed(self, count, seed_runs):
+        users = []
+        rng = random.Random(count)
+        for i in range(count):
+            user, created = User.objects.get_or_create(username=f"{USERNAME_PREFIX}{i}")
+            profile, _ = Profile.objects.get_or_create(user=user)
+            ensure_default_zones(profile)
+            if created:
+                today = _date.today()
+                Run.objects.bulk_create([
+                    Run(user=user, date=today - timedelta(days=rng.randrange(365)), run_type="EASY",
+                        distance_km=round(rng.uniform(3, 21), 2), pace_min_km=f"{rng.randint(4, 6)}:{rng.randint(0, 59):02d}")
+                    for _ in range(seed_runs)
+                ], batch_size=1000)
+            zones = list(HeartRateZone.objects.filter(profile=profile).values_list("id", "zone_number", "hr_min", "hr_max"))
+            users.append((user, zones))
+        return users
+
+    def _run_threads(self, sims, duration, stats, target):
+        if target == "wsgi":
+            from PacePower.wsgi import application
+            send = lambda *request: wsgi_request(application, *request)
+        else:
+            send = lambda *request: http_request(target, *request)
+
+        deadline = time.perf_counter() + duration
+
+        def worker(sim):
+            try:
+                while time.perf_counter() < deadline:
+                    action, method, path, body, headers = sim.next_request()
+                    start = time.perf_counter()
+                    try:
+                        status = send(path, method, body, headers)["status"]
+                    except Exception as exc:
+                        status = type(exc).__name__
+                    stats.record(action, status, time.perf_counter() - start)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(sim,)) for sim in sims]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - start
+
+    async def _run_asgi(self, sims, duration, stats):
+        from PacePower.asgi import application
+
+        deadline = time.perf_counter() + duration
+
+        async def worker(sim):
+            while time.perf_counter() < deadline:
+                action, method, path, body, headers = sim.next_request()
+                start = time.perf_counter()
+                try:
+                    status = (await asgi_request(application, path, method, body, headers))["status"]
+                except Exception as exc:
+                    status = type(exc).__name__
+                stats.record(action, status, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(sim) for sim in sims))
+        return time.perf_counter() - start
+
+    def _report(self, target, users, elapsed, stats, sampler):
+        total = sum(len(v) for v in stats.latencies.values())
+        self.stdout.write(f"target {target}, {users} users, {elapsed:.1f} s, {total} requests, {total / elapsed:.1f} req/s")
+        self.stdout.write(f"{'action':<16}{'count':>8}{'req/s':>9}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for action in sorted(stats.latencies):
+            ms = [s * 1000 for s in stats.latencies[action]]
+            self.stdout.write(
+                f"{action:<16}{len(ms):>8}{len(ms) / elapsed:>9.1f}{percentile(ms, 50):>10.1f}"
+                f"{percentile(ms, 90):>10.1f}{percentile(ms, 99):>10.1f}{max(ms):>10.1f}"
+            )
+        everything = [s * 1000 for samples in stats.latencies.values() for s in samples]
+        self.stdout.write(
+            f"{'all':<16}{len(everything):>8}{total / elapsed:>9.1f}{percentile(everything, 50):>10.1f}"
+            f"{percentile(everything, 90):>10.1f}{percentile(everything, 99):>10.1f}{max(everything, default=0):>10.1f}"
+        )
+        self.stdout.write("status codes: " + ", ".join(f"{k}={v}" for k, v in sorted(stats.statuses.items(), key=str)))
+        line = f"DB connections opened in-process: {stats.connections}"
+        if sampler.peak is not None:
+            line += f", peak server connections (pg_stat_activity): {sampler.peak}"
+        self.stdout.write(line)
+
+
+# Latency samples and status codes, shared by the worker threads
+class LoadStats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = Counter()
+        self.connections = 0
+        self._lock = threading.Lock()
+
+    def record(self, action, status, seconds):
+        with self._lock:
+            self.latencies[action].append(seconds)
+            self.statuses[status] += 1
+
+    def on_connection(self, sender, connection, **kwargs):
+        if isinstance(threading.current_thread(), ConnectionSampler):
+            return
+        with self._lock:
+            self.connections += 1
+
+
+# Peak number of connections to the database seen by PostgreSQL during the test,
+# which also covers connections of an external server
+class ConnectionSampler(threading.Thread):
+    INTERVAL = 0.2
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.peak = None
+        self._done = threading.Event()
+
+    def run(self):
+        if connection.vendor != "postgresql":
+            return
+        try:
+            with connection.cursor() as cursor:
+                while not self._done.is_set():
+                    cursor.execute("SELECT count(*) FROM pg_stat_activity WHERE datname = current_database()")
+                    # minus this sampler's own connection
+                    self.peak = max(self.peak or 0, cursor.fetchone()[0] - 1)
+                    self._done.wait(self.INTERVAL)
+        finally:
+            connection.close()
+
+    def stop(self):
+        self._done.set()
+        self.join()
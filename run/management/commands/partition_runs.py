@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from run.partitioning import convert_to_partitioned, create_future_partitions
+
+
+class Command(BaseCommand):
+    help = "Partition the Run table by year (PostgreSQL) and keep future partitions ahead"
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=["convert", "create"],
+                            help="convert: move run_run into a partitioned table; create: add upcoming yearly partitions")
+        parser.add_argument("--years-ahead", type=int, default=1)
+
+    def handle(self, *args, **options):
+        try:
+            if options["action"] == "convert":
+                dropped = convert_to_partitioned(options["years_ahead"])
+                self.stdout.write("run_run is now partitioned by year")
+                for table, name in dropped:
+                    self.stdout.write(f"Dropped foreign key {name} on {table}")
+            else:
+                created = create_future_partitions(options["years_ahead"])
+                self.stdout.write(f"Created partitions: {', '.join(map(str, created)) or 'none needed'}")
+        except RuntimeError as exc:
+            raise CommandError(str(exc))
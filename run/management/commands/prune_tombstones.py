@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from run.sync import TOMBSTONE_RETENTION, prune_tombstones
+
+
+class Command(BaseCommand):
+    help = f"Delete sync tombstones older than {TOMBSTONE_RETENTION.days} days"
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Deleted {prune_tombstones()} tombstone(s)")
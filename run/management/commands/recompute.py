@@ -0,0 +1,86 @@
+import multiprocessing
+import os
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from run.recompute import RECOMPUTE_STEPS, recompute_users_task, recompute_users
+
+
+CHECKPOINT_HEADER = "# steps: "
+
+
+class Command(BaseCommand):
+    help = "Recompute derived data for every user, sharded across a process pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--steps", default=",".join(RECOMPUTE_STEPS), help=f"comma separated, from: {', '.join(RECOMPUTE_STEPS)}")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+        parser.add_argument("--chunk-size", type=int, default=50, help="users per task")
+        parser.add_argument("--checkpoint", help="file of finished user ids, skipped when the command runs again with the same steps")
+
+    def handle(self, *args, **options):
+        steps = [s.strip() for s in options["steps"].split(",") if s.strip()]
+        unknown = [s for s in steps if s not in RECOMPUTE_STEPS]
+        if unknown or not steps:
+            raise CommandError(f"Unknown steps: {', '.join(unknown) or '(none given)'}")
+
+        finished = self._read_checkpoint(options["checkpoint"], steps)
+        user_ids = [uid for uid in User.objects.order_by("id").values_list("id", flat=True).iterator(chunk_size=5000)
+                    if uid not in finished]
+        chunk = max(1, options["chunk_size"])
+        tasks = [(user_ids[i:i + chunk], steps) for i in range(0, len(user_ids), chunk)]
+        self.stdout.write(f"{len(user_ids)} users to recompute ({len(finished)} already done), steps: {', '.join(steps)}")
+
+        checkpoint = open(options["checkpoint"], "a") if options["checkpoint"] else None
+        if checkpoint and checkpoint.tell() == 0:
+            checkpoint.write(f"{CHECKPOINT_HEADER}{','.join(steps)}\n")
+        start = time.perf_counter()
+        users = rows = 0
+        failed = []
+        try:
+            for done, chunk_failed, chunk_rows, _ in self._results(tasks, options["workers"]):
+                users += len(done)
+                rows += chunk_rows
+                failed += chunk_failed
+                if checkpoint:
+                    checkpoint.writelines(f"{uid}\n" for uid in done)
+                    checkpoint.flush()
+                elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f"{users}/{len(user_ids)} users, {rows} rows, "
+                    f"{users / elapsed:.1f} users/s, {rows / elapsed:.1f} rows/s"
+                )
+        finally:
+            if checkpoint:
+                checkpoint.close()
+
+        if failed:
+            self.stderr.write(f"Failed users (not checkpointed): {', '.join(map(str, failed))}")
+        self.stdout.write(f"Recomputed {users} users in {time.perf_counter() - start:.1f}s")
+
+    def _results(self, tasks, workers):
+        if workers <= 1:
+            for task in tasks:
+                yield recompute_users(*task)
+            return
+        # children must not share the parent's connection; each opens its own
+        connections.close_all()
+        with multiprocessing.get_context("fork").Pool(workers) as pool:
+            yield from pool.imap_unordered(recompute_users_task, tasks)
+
+    # Users finished by an earlier run; its steps, from the header line, must match
+    def _read_checkpoint(self, path, steps):
+        if not path or not os.path.exists(path) or not os.path.getsize(path):
+            return set()
+        with open(path) as fh:
+            header = fh.readline().strip()
+            if not header.startswith(CHECKPOINT_HEADER):
+                raise CommandError(f"{path} has no steps header, remove it to start over")
+            recorded = header[len(CHECKPOINT_HEADER):].split(",")
+            if recorded != steps:
+                raise CommandError(
+                    f"{path} is a checkpoint of steps {','.join(recorded)}, not {','.join(steps)}; "
+                    "use another file or the same steps"
+                )
+            return {int(line) for line in fh if line.strip()}
@@ -0,0 +1,25 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from run.goals import reconcile_user
+
+
+class Command(BaseCommand):
+    help = "Rebuild weekly and monthly goal counters from the runs and report drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="username, default is every user")
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by("id")
+        if options["user"]:
+            users = users.filter(username=options["user"])
+            if not users.exists():
+                raise CommandError(f"User {options['user']!r} does not exist")
+        checked = fixed = 0
+        for user_id, username in users.values_list("id", "username").iterator(chunk_size=2000):
+            rows = reconcile_user(user_id)
+            checked += 1
+            if rows:
+                fixed += rows
+                self.stdout.write(f"{username}: fixed {rows} counters")
+        self.stdout.write(f"Checked {checked} users, fixed {fixed} counters")
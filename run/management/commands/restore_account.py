@@ -0,0 +1,29 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from run.backup import BackupError, restore_backup
+
+
+class Command(BaseCommand):
+    help = "Load an account backup ZIP (from /account/export/) into a user without runs or plans"
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("zip_path")
+        parser.add_argument("--create", action="store_true", help="create the user if it does not exist")
+
+    def handle(self, *args, **options):
+        username = options["username"]
+        try:
+            user = User.objects.get(username=username)
+        except User.DoesNotExist:
+            if not options["create"]:
+                raise CommandError(f"User {username!r} does not exist, use --create")
+            user = User.objects.create_user(username=username)
+        try:
+            with open(options["zip_path"], "rb") as fh:
+                counts = restore_backup(user, fh)
+        except BackupError as exc:
+            raise CommandError(str(exc))
+        for name, count in counts.items():
+            self.stdout.write(f"{name}: {count}")
+        self.stdout.write(f"Restored {sum(counts.values())} rows for {username}")
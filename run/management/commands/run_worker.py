@@ -0,0 +1,43 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from run.jobs import claim_next_job, purge_finished_jobs, requeue_stale_jobs, run_job
+
+
+PURGE_EVERY = 60 * 60
+
+
+class Command(BaseCommand):
+    help = "Process background jobs from the database queue"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="exit when no job is due")
+        parser.add_argument("--sleep", type=float, default=1.0, help="seconds to wait when the queue is empty")
+        parser.add_argument("--max-jobs", type=int, default=0, help="exit after this many jobs (0 = no limit)")
+
+    def handle(self, *args, **options):
+        processed = 0
+        purged_at = None
+        try:
+            while not options["max_jobs"] or processed < options["max_jobs"]:
+                close_old_connections()
+                requeued = requeue_stale_jobs()
+                if requeued:
+                    self.stdout.write(f"Requeued {requeued} stale job(s)")
+                if purged_at is None or time.monotonic() - purged_at >= PURGE_EVERY:
+                    purged = purge_finished_jobs()
+                    purged_at = time.monotonic()
+                    if purged:
+                        self.stdout.write(f"Purged {purged} finished job(s)")
+                job = claim_next_job()
+                if job is None:
+                    if options["once"]:
+                        break
+                    time.sleep(options["sleep"])
+                    continue
+                ok = run_job(job)
+                processed += 1
+                self.stdout.write(f"{'done' if ok else 'failed'}: {job.kind} #{job.pk} (attempt {job.attempts})")
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f"Processed {processed} job(s)")
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-19 07:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('run', '0008_sync_tracking'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='run',
+            index=models.Index(fields=['user', 'date'], name='run_run_user_id_df5b40_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-19 07:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('run', '0010_job'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='plannedrun',
+            index=models.Index(fields=['date', 'id'], name='run_planned_date_f0d309_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='run',
+            index=models.Index(fields=['date', 'id'], name='run_run_date_11a454_idx'),
+        ),
+    ]
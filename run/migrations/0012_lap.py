@@ -0,0 +1,34 @@
+# Generated by Django 5.2.4 on 2026-10-19 07:43
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('run', '0011_admin_date_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Lap',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveSmallIntegerField()),
+                ('distance_km', models.FloatField(validators=[django.core.validators.MinValueValidator(0.01)])),
+                ('duration_seconds', models.PositiveIntegerField()),
+                ('heart_rate', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('run', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='laps', to='run.run')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='laps', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['run', 'number'],
+                'indexes': [models.Index(fields=['user', 'distance_km', 'duration_seconds'], name='run_lap_user_id_0c2efb_idx')],
+                'unique_together': {('run', 'number')},
+            },
+        ),
+    ]
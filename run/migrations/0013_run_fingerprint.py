@@ -0,0 +1,68 @@
+# Generated by Django 5.2.4 on 2026-10-19 07:44
+
+import hashlib
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Frozen copy of run.models.run_fingerprint as of this migration
+def run_fingerprint(user_id, run_date, distance_km, pace_min_km, start_time=None):
+    m, s = pace_min_km.split(':')
+    parts = [
+        str(user_id),
+        run_date.isoformat(),
+        f'{float(distance_km):.2f}',
+        str(int(m) * 60 + int(s)),
+        start_time.strftime('%H:%M') if start_time else '',
+    ]
+    return hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+
+# Fingerprint the existing runs; a repeat of a run on the same day keeps an empty
+# fingerprint, the unique constraint added below would reject it otherwise
+def backfill_fingerprints(apps, schema_editor):
+    Run = apps.get_model('run', 'Run')
+    day, seen, batch = None, set(), []
+    for run in Run.objects.order_by('user_id', 'date', 'id').iterator(chunk_size=2000):
+        if (run.user_id, run.date) != day:
+            day, seen = (run.user_id, run.date), set()
+        try:
+            fingerprint = run_fingerprint(run.user_id, run.date, run.distance_km, run.pace_min_km, run.start_time)
+        except ValueError:
+            continue
+        if fingerprint in seen:
+            continue
+        seen.add(fingerprint)
+        run.fingerprint = fingerprint
+        batch.append(run)
+        if len(batch) >= 2000:
+            Run.objects.bulk_update(batch, ['fingerprint'])
+            batch = []
+    Run.objects.bulk_update(batch, ['fingerprint'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('run', '0012_lap'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='run',
+            name='fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=40),
+        ),
+        migrations.AddField(
+            model_name='run',
+            name='start_time',
+            field=models.TimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_fingerprints, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='run',
+            constraint=models.UniqueConstraint(condition=models.Q(('fingerprint', ''), _negated=True), fields=('user', 'date', 'fingerprint'), name='run_run_unique_fingerprint'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.4 on 2026-10-19 07:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('run', '0014_goals'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HeartRateStream',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('samples', models.BinaryField()),
+                ('run', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='hr_stream', to='run.run')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hr_streams', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='WeeklyZoneTime',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week_start', models.DateField()),
+                ('z1_seconds', models.PositiveIntegerField(default=0)),
+                ('z2_seconds', models.PositiveIntegerField(default=0)),
+                ('z3_seconds', models.PositiveIntegerField(default=0)),
+                ('z4_seconds', models.PositiveIntegerField(default=0)),
+                ('z5_seconds', models.PositiveIntegerField(default=0)),
+                ('estimated_seconds', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='weekly_zone_times', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['week_start'],
+                'unique_together': {('user', 'week_start')},
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-19 07:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('run', '0015_zone_time'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', 'name'], name='run_tag_user_name_prefix', opclasses=['int4_ops', 'varchar_pattern_ops']),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.4 on 2026-10-19 09:18
+
+import hashlib
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Frozen copy of run.models.run_fingerprint as of this migration
+def run_fingerprint(user_id, run_date, distance_km, pace_min_km, start_time=None):
+    m, s = pace_min_km.split(':')
+    parts = [
+        str(user_id),
+        run_date.isoformat(),
+        f'{float(distance_km):.2f}',
+        str(int(m) * 60 + int(s)),
+        start_time.strftime('%H:%M') if start_time else '',
+    ]
+    return hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+
+# Repeats of a run on the same day were left without a fingerprint by 0013; with
+# the constraint limited to imported runs they can have one. Existing rows are
+# not known to be imported and stay unflagged.
+def fingerprint_repeats(apps, schema_editor):
+    Run = apps.get_model('run', 'Run')
+    batch = []
+    for run in Run.objects.filter(fingerprint='').iterator(chunk_size=2000):
+        try:
+            run.fingerprint = run_fingerprint(run.user_id, run.date, run.distance_km, run.pace_min_km, run.start_time)
+        except ValueError:
+            continue
+        batch.append(run)
+        if len(batch) >= 2000:
+            Run.objects.bulk_update(batch, ['fingerprint'])
+            batch = []
+    Run.objects.bulk_update(batch, ['fingerprint'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('run', '0017_clubs'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='run',
+            name='run_run_unique_fingerprint',
+        ),
+        migrations.AddField(
+            model_name='run',
+            name='imported',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(fingerprint_repeats, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='run',
+            index=models.Index(fields=['user', 'date', 'fingerprint'], name='run_run_user_date_fp'),
+        ),
+        migrations.AddConstraint(
+            model_name='run',
+            constraint=models.UniqueConstraint(condition=models.Q(('imported', True), models.Q(('fingerprint', ''), _negated=True)), fields=('user', 'date', 'fingerprint'), name='run_run_unique_fingerprint'),
+        ),
+    ]
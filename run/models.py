@@ -1,6 +1,9 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator
+from django.utils import timezone
+from django.db.models.functions import Cast, StrIndex, Substr
+import hashlib
 import re
 
 
@@ -23,6 +26,44 @@ def validate_mm_ss(value: str):
         raise ValueError("Use 'mm:ss' format, e.g. 5:30")
 
 
+# Pace 'mm:ss' as seconds, computed in the database
+def pace_seconds_expression(field: str = "pace_min_km"):
+    colon = StrIndex(field, models.Value(":"))
+    minutes = Cast(Substr(field, 1, colon - 1), models.IntegerField())
+    seconds = Cast(Substr(field, colon + 1), models.IntegerField())
+    return minutes * 60 + seconds
+
+
+# Average of the numbers in a free-text HR value like '145' or '140-150'
+def parse_heart_rate(value: str):
+    numbers = [int(n) for n in re.findall(r"\d{2,3}", value or "")]
+    if not numbers:
+        return None
+    return sum(numbers) / len(numbers)
+
+
+# The same average computed in the database (PostgreSQL), NULL without a number
+def heart_rate_expression(field: str = "heart_rate"):
+    return models.Func(
+        models.F(field),
+        template="(SELECT AVG(m[1]::int)::float FROM regexp_matches(%(expressions)s, '\\d{2,3}', 'g') AS m)",
+        output_field=models.FloatField(),
+    )
+
+
+# Stable identity of a run's content, used to skip duplicates on import
+def run_fingerprint(user_id, run_date, distance_km, pace_min_km, start_time=None) -> str:
+    m, s = pace_min_km.split(":")
+    parts = [
+        str(user_id),
+        run_date.isoformat(),
+        f"{float(distance_km):.2f}",
+        str(int(m) * 60 + int(s)),
+        start_time.strftime("%H:%M") if start_time else "",
+    ]
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()
+
+
 # Tag owned by a user
 class Tag(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="tags")
@@ -31,6 +72,10 @@ class Tag(models.Model):
     class Meta:
         unique_together = (("user", "name"),)
         ordering = ["name"]
+        indexes = [
+            # LIKE 'prefix%' for tag autocomplete, independent of the database collation
+            models.Index(fields=["user", "name"], name="run_tag_user_name_prefix", opclasses=["int4_ops", "varchar_pattern_ops"]),
+        ]
 
     def __str__(self):
         return self.name
@@ -47,21 +92,123 @@ class Run(models.Model):
     zone = models.CharField(max_length=10, blank=True)
     notes = models.TextField(blank=True)
     tags = models.ManyToManyField(Tag, blank=True, related_name="runs")
+    start_time = models.TimeField(null=True, blank=True)
+    # set on every save, imports skip rows whose fingerprint is stored (run/importer.py)
+    fingerprint = models.CharField(max_length=40, blank=True, editable=False)
+    # inserted by an import; only these must be unique, runs logged by hand may repeat
+    imported = models.BooleanField(default=False, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ["-date"]
+        indexes = [
+            models.Index(fields=["user", "date"]),
+            models.Index(fields=["user", "updated_at"]),
+            # admin changelist ordering and date filter across all users
+            models.Index(fields=["date", "id"]),
+            # the import's lookup of stored fingerprints, imported or not
+            models.Index(fields=["user", "date", "fingerprint"], name="run_run_user_date_fp"),
+        ]
+        constraints = [
+            # includes date so it stays valid on the partitioned table
+            models.UniqueConstraint(
+                fields=["user", "date", "fingerprint"],
+                condition=models.Q(imported=True) & ~models.Q(fingerprint=""),
+                name="run_run_unique_fingerprint",
+            ),
+        ]
+
+    # Remember stored values so signal handlers can tell what an edit changed
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
 
     # Readable representation
     def __str__(self):
         return f"{self.user.username} {self.date} {self.distance_km} km @ {self.pace_min_km}"
 
+    def compute_fingerprint(self) -> str:
+        return run_fingerprint(
+            self.user_id,
+            self._meta.get_field("date").to_python(self.date),
+            self.distance_km,
+            self.pace_min_km,
+            self._meta.get_field("start_time").to_python(self.start_time),
+        )
+
+    # Two imported runs with the same content would break the unique fingerprint;
+    # checked here so the admin reports it instead of a 500
+    def clean(self):
+        if not self.imported or self.user_id is None or self.date is None or self.distance_km is None or not self.pace_min_km:
+            return
+        try:
+            fingerprint = self.compute_fingerprint()
+        except ValueError:
+            return  # invalid pace, reported on the field
+        duplicates = Run.objects.filter(user_id=self.user_id, date=self.date, fingerprint=fingerprint, imported=True)
+        if self.pk:
+            duplicates = duplicates.exclude(pk=self.pk)
+        if duplicates.exists():
+            from django.core.exceptions import ValidationError
+            raise ValidationError("An imported run with the same date, distance, pace and start time already exists.")
+
+    # Fingerprint the content on every save, so imports also skip manually logged runs
+    def save(self, *args, **kwargs):
+        self.fingerprint = self.compute_fingerprint()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "fingerprint"}
+        super().save(*args, **kwargs)
+
     # Get pace in seconds
     @property
     def pace_seconds(self) -> int:
         m, s = self.pace_min_km.split(":")
         return int(m) * 60 + int(s)
+
+    # Average heart rate parsed from the free-text field
+    @property
+    def heart_rate_avg(self):
+        return parse_heart_rate(self.heart_rate)
     
 
+# Single lap or split of a run
+class Lap(models.Model):
+    # no database-level FK, run_run may be partitioned (see run/partitioning.py)
+    run = models.ForeignKey(Run, on_delete=models.CASCADE, related_name="laps", db_constraint=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="laps")
+    number = models.PositiveSmallIntegerField()
+    distance_km = models.FloatField(validators=[MinValueValidator(0.01)])
+    duration_seconds = models.PositiveIntegerField()
+    heart_rate = models.PositiveSmallIntegerField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["run", "number"]
+        unique_together = (("run", "number"),)
+        indexes = [models.Index(fields=["user", "distance_km", "duration_seconds"])]
+
+    def __str__(self):
+        return f"Lap {self.number}: {self.distance_km} km in {self.duration_seconds}s"
+
+    # Pace in seconds per km
+    @property
+    def pace_seconds(self) -> float:
+        return self.duration_seconds / self.distance_km
+
+
+# Per-second heart rate of a run, one unsigned byte per sample and 0 for dropouts
+class HeartRateStream(models.Model):
+    # no database-level FK, run_run may be partitioned (see run/partitioning.py)
+    run = models.OneToOneField(Run, on_delete=models.CASCADE, related_name="hr_stream", db_constraint=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="hr_streams")
+    samples = models.BinaryField()
+
+    def __str__(self):
+        return f"HR stream of run {self.run_id} ({len(self.samples)} s)"
+
+
 # User profile - zones in separate records
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="profile")
@@ -127,10 +274,180 @@ class PlannedRun(models.Model):
     distance_km = models.FloatField(null=True, blank=True, validators=[MinValueValidator(0.01)])
     pace_target = models.CharField(max_length=5, blank=True, validators=[validate_mm_ss])
     notes = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ["date"]
+        indexes = [
+            models.Index(fields=["user", "updated_at"]),
+            models.Index(fields=["date", "id"]),
+        ]
 
     def __str__(self):
-        return f"{self.plan.name} - {self.date} {self.run_type}"
-    
+        plan = self.plan.name if self.plan_id else "No plan"
+        return f"{plan} - {self.date} {self.run_type}"
+
+
+SYNC_MODEL_CHOICES = [
+    ("run", "Run"),
+    ("planned_run", "Planned run"),
+]
+
+
+# Marker left behind when a synced row is deleted
+class Tombstone(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="tombstones")
+    model = models.CharField(max_length=20, choices=SYNC_MODEL_CHOICES)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["user", "deleted_at"])]
+
+    def __str__(self):
+        return f"{self.model} #{self.object_id} deleted {self.deleted_at}"
+
+
+JOB_STATUS_CHOICES = [
+    ("queued", "Queued"),
+    ("running", "Running"),
+    ("done", "Done"),
+    ("failed", "Failed"),
+]
+
+
+# Background job picked up by `manage.py run_worker`
+class Job(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="jobs")
+    kind = models.CharField(max_length=40)
+    dedup_key = models.CharField(max_length=64, blank=True)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=JOB_STATUS_CHOICES, default="queued")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    progress = models.PositiveIntegerField(default=0)
+    progress_total = models.PositiveIntegerField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    run_after = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            # at most one waiting job per user and kind, later requests join it
+            models.UniqueConstraint(
+                fields=["user", "kind", "dedup_key"],
+                condition=models.Q(status="queued"),
+                name="run_job_one_queued_per_key",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["run_after", "id"], condition=models.Q(status="queued"), name="run_job_queued_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+
+GOAL_METRIC_CHOICES = [
+    ("distance", "Distance (km)"),
+    ("runs", "Runs"),
+]
+
+GOAL_PERIOD_CHOICES = [
+    ("week", "Week"),
+    ("month", "Month"),
+]
+
+
+# Running totals of a user's runs per week and month, kept up to date incrementally
+class PeriodTotal(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="period_totals")
+    period = models.CharField(max_length=5, choices=GOAL_PERIOD_CHOICES)
+    period_start = models.DateField()
+    distance_km = models.FloatField(default=0)
+    runs = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = (("user", "period", "period_start"),)
+
+    def __str__(self):
+        return f"{self.user_id} {self.period} {self.period_start}: {self.distance_km:.1f} km / {self.runs} runs"
+
+
+# Target such as 40 km per week or 12 runs per month
+class Goal(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="goals")
+    metric = models.CharField(max_length=10, choices=GOAL_METRIC_CHOICES)
+    period = models.CharField(max_length=5, choices=GOAL_PERIOD_CHOICES)
+    target = models.FloatField(validators=[MinValueValidator(0.01)])
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = (("user", "metric", "period"),)
+        ordering = ["period", "metric"]
+
+    def __str__(self):
+        return f"{self.target:g} {self.get_metric_display()} per {self.period}"
+
+
+# Seconds spent in each heart rate zone during one week (Monday start)
+class WeeklyZoneTime(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="weekly_zone_times")
+    week_start = models.DateField()
+    z1_seconds = models.PositiveIntegerField(default=0)
+    z2_seconds = models.PositiveIntegerField(default=0)
+    z3_seconds = models.PositiveIntegerField(default=0)
+    z4_seconds = models.PositiveIntegerField(default=0)
+    z5_seconds = models.PositiveIntegerField(default=0)
+    # part of the above derived from run averages rather than HR streams
+    estimated_seconds = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = (("user", "week_start"),)
+        ordering = ["week_start"]
+
+    def __str__(self):
+        return f"{self.user_id} week of {self.week_start}"
+
+    @property
+    def zone_seconds(self):
+        return [self.z1_seconds, self.z2_seconds, self.z3_seconds, self.z4_seconds, self.z5_seconds]
+
+
+# Group of users sharing leaderboards, joined with an invite code
+class Club(models.Model):
+    name = models.CharField(max_length=80)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="owned_clubs")
+    invite_code = models.CharField(max_length=32, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+
+class ClubMembership(models.Model):
+    club = models.ForeignKey(Club, on_delete=models.CASCADE, related_name="memberships")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="club_memberships")
+    joined_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = (("club", "user"),)
+
+    def __str__(self):
+        return f"{self.user_id} in {self.club_id}"
+
+
+# Leaderboard of a finished week or month, stored once and never recomputed
+class LeaderboardSnapshot(models.Model):
+    club = models.ForeignKey(Club, on_delete=models.CASCADE, related_name="snapshots")
+    period = models.CharField(max_length=5, choices=GOAL_PERIOD_CHOICES)
+    period_start = models.DateField()
+    entries = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = (("club", "period", "period_start"),)
+
+    def __str__(self):
+        return f"{self.club_id} {self.period} {self.period_start}"
@@ -0,0 +1,150 @@
+from datetime import date as _date
+from django.db import connection, transaction
+from .models import Run
+
+
+# PostgreSQL declarative range partitioning of the Run table by year.
+#
+# Django keeps seeing `id` as the primary key; in the database the key becomes
+# (id, date) because a partitioned table's unique keys must include the
+# partition key. Foreign keys pointing at run_run cannot reference a partitioned
+# table without the date, so they are dropped and the ORM's cascades keep the
+# referencing rows consistent.
+
+TABLE = Run._meta.db_table
+DEFAULT_PARTITION = f"{TABLE}_default"
+
+
+def partition_name(year: int) -> str:
+    return f"{TABLE}_y{year}"
+
+
+def _qn(name: str) -> str:
+    return connection.ops.quote_name(name)
+
+
+def _suffixed(name: str, suffix: str) -> str:
+    return name[:63 - len(suffix)] + suffix
+
+
+def _check_postgres():
+    if connection.vendor != "postgresql":
+        raise RuntimeError("Run partitioning requires PostgreSQL")
+
+
+def is_partitioned(cursor) -> bool:
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [TABLE])
+    row = cursor.fetchone()
+    return bool(row) and row[0] == "p"
+
+
+# Years that currently have their own partition
+def existing_partition_years(cursor):
+    cursor.execute(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(%s)",
+        [TABLE],
+    )
+    prefix = partition_name(0)[:-1]
+    return sorted(int(name[len(prefix):]) for (name,) in cursor.fetchall() if name.startswith(prefix))
+
+
+def _create_year_partition(cursor, year):
+    cursor.execute(
+        f"CREATE TABLE {_qn(partition_name(year))} PARTITION OF {_qn(TABLE)} "
+        f"FOR VALUES FROM ('{_date(year, 1, 1).isoformat()}') TO ('{_date(year + 1, 1, 1).isoformat()}')"
+    )
+
+
+# Add yearly partitions up to `years_ahead` past the current year.
+# Rows that already landed in the default partition for such a year are moved.
+def create_future_partitions(years_ahead=1, today=None):
+    _check_postgres()
+    today = today or _date.today()
+    created = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        if not is_partitioned(cursor):
+            raise RuntimeError(f"{TABLE} is not partitioned yet, run the conversion first")
+        existing = set(existing_partition_years(cursor))
+        for year in range(today.year, today.year + years_ahead + 1):
+            if year in existing:
+                continue
+            bounds = [_date(year, 1, 1), _date(year + 1, 1, 1)]
+            cursor.execute(f"ALTER TABLE {_qn(TABLE)} DETACH PARTITION {_qn(DEFAULT_PARTITION)}")
+            _create_year_partition(cursor, year)
+            cursor.execute(
+                f"WITH moved AS (DELETE FROM {_qn(DEFAULT_PARTITION)} WHERE date >= %s AND date < %s RETURNING *) "
+                f"INSERT INTO {_qn(TABLE)} SELECT * FROM moved",
+                bounds,
+            )
+            cursor.execute(f"ALTER TABLE {_qn(TABLE)} ATTACH PARTITION {_qn(DEFAULT_PARTITION)} DEFAULT")
+            created.append(year)
+    return created
+
+
+# Replace the plain run_run table with a partitioned one holding the same rows
+def convert_to_partitioned(years_ahead=1, today=None):
+    _check_postgres()
+    today = today or _date.today()
+    legacy = f"{TABLE}_legacy"
+    with transaction.atomic(), connection.cursor() as cursor:
+        if is_partitioned(cursor):
+            raise RuntimeError(f"{TABLE} is already partitioned")
+
+        # everything that has to be rebuilt, captured while names still point at the old table
+        cursor.execute(
+            "SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = to_regclass(%s)",
+            [TABLE],
+        )
+        constraints = cursor.fetchall()
+        cursor.execute(
+            "SELECT c.relname, pg_get_indexdef(i.indexrelid) FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE i.indrelid = to_regclass(%s) AND NOT EXISTS (SELECT 1 FROM pg_constraint k WHERE k.conindid = i.indexrelid)",
+            [TABLE],
+        )
+        indexes = cursor.fetchall()
+        cursor.execute(
+            "SELECT conrelid::regclass::text, conname FROM pg_constraint WHERE confrelid = to_regclass(%s) AND contype = 'f'",
+            [TABLE],
+        )
+        referencing = cursor.fetchall()
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [TABLE])
+        sequence = cursor.fetchone()[0]
+        cursor.execute(f"SELECT EXTRACT(YEAR FROM MIN(date))::int, COALESCE(MAX(id), 0) FROM {_qn(TABLE)}")
+        first_year, max_id = cursor.fetchone()
+
+        # free up the names for the new table
+        for table, name in referencing:
+            cursor.execute(f"ALTER TABLE {table} DROP CONSTRAINT {_qn(name)}")
+        cursor.execute(f"ALTER TABLE {_qn(TABLE)} RENAME TO {_qn(legacy)}")
+        for name, _, _ in constraints:
+            cursor.execute(f"ALTER TABLE {_qn(legacy)} RENAME CONSTRAINT {_qn(name)} TO {_qn(_suffixed(name, '_old'))}")
+        for name, _ in indexes:
+            cursor.execute(f"ALTER INDEX {_qn(name)} RENAME TO {_qn(_suffixed(name, '_old'))}")
+        if sequence:
+            cursor.execute(f"ALTER SEQUENCE {sequence} RENAME TO {_qn(f'{legacy}_id_seq')}")
+
+        cursor.execute(
+            f"CREATE TABLE {_qn(TABLE)} (LIKE {_qn(legacy)} INCLUDING DEFAULTS INCLUDING STORAGE) PARTITION BY RANGE (date)"
+        )
+        seq = f"{TABLE}_id_seq"
+        cursor.execute(f"CREATE SEQUENCE {_qn(seq)} OWNED BY {_qn(TABLE)}.id")
+        cursor.execute(f"ALTER TABLE {_qn(TABLE)} ALTER COLUMN id SET DEFAULT nextval('{seq}')")
+        for name, kind, definition in constraints:
+            if kind == "n":
+                continue  # NOT NULL came along with LIKE
+            if kind == "p":
+                cursor.execute(f"ALTER TABLE {_qn(TABLE)} ADD CONSTRAINT {_qn(name)} PRIMARY KEY (id, date)")
+            else:
+                cursor.execute(f"ALTER TABLE {_qn(TABLE)} ADD CONSTRAINT {_qn(name)} {definition}")
+        for _, definition in indexes:
+            cursor.execute(definition)
+
+        for year in range(min(first_year or today.year, today.year), today.year + years_ahead + 1):
+            _create_year_partition(cursor, year)
+        cursor.execute(f"CREATE TABLE {_qn(DEFAULT_PARTITION)} PARTITION OF {_qn(TABLE)} DEFAULT")
+
+        cursor.execute(f"INSERT INTO {_qn(TABLE)} SELECT * FROM {_qn(legacy)}")
+        cursor.execute("SELECT setval(%s, %s, %s)", [seq, max(max_id, 1), max_id > 0])
+        cursor.execute(f"DROP TABLE {_qn(legacy)}")
+        cursor.execute(f"ANALYZE {_qn(TABLE)}")
+    return referencing
@@ -0,0 +1,54 @@
+import logging
+import time
+from .goals import reconcile_user
+from .zone_time import update_zone_weeks
+from .zones import reclassify_runs
+
+
+logger = logging.getLogger(__name__)
+
+RECOMPUTE_STEPS = {}
+
+
+# Register a function(user_id) -> rows processed as a per-user recompute step
+def recompute_step(name):
+    def register(func):
+        RECOMPUTE_STEPS[name] = func
+        return func
+    return register
+
+
+@recompute_step("zones")
+def zones_step(user_id):
+    return reclassify_runs(user_id)
+
+
+@recompute_step("period_totals")
+def period_totals_step(user_id):
+    return reconcile_user(user_id)
+
+
+@recompute_step("zone_weeks")
+def zone_weeks_step(user_id):
+    return update_zone_weeks(user_id)
+
+
+# Run the steps for a chunk of users; returns (done ids, failed ids, rows, seconds)
+def recompute_users(user_ids, steps):
+    start = time.perf_counter()
+    done, failed, rows = [], [], 0
+    for user_id in user_ids:
+        try:
+            for name in steps:
+                rows += RECOMPUTE_STEPS[name](user_id) or 0
+        except Exception:
+            logger.exception("Recompute failed for user %s", user_id)
+            failed.append(user_id)
+        else:
+            done.append(user_id)
+    return done, failed, rows, time.perf_counter() - start
+
+
+# Pool entry point; a forked worker opens its own DB connection on first query
+def recompute_users_task(args):
+    return recompute_users(*args)
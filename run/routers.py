@@ -0,0 +1,113 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.connection import ConnectionProxy
+from django.utils.decorators import sync_and_async_middleware
+
+
+REPLICA_ALIAS = "replica"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS", "TRACE")
+
+# versions and replica pins, kept apart from the culled fragment cache (settings.CACHES)
+state_cache = ConnectionProxy(caches, "state")
+
+# alias reads go to while an analytics view runs; None means the router stays out of it
+_read_alias = ContextVar("read_alias", default=None)
+
+
+# Reads go to the replica only inside analytics views, writes always to the primary
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # the database cache holds versions and pins, a lagging copy of it is useless
+        if model._meta.app_label == "django_cache":
+            return "default"
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == "default"
+
+
+def _pin_key(user_id):
+    return f"replica-pin:{user_id}"
+
+
+def is_pinned(user_id) -> bool:
+    return bool(user_id) and state_cache.get(_pin_key(user_id)) is not None
+
+
+# Keep a user on the primary for a while so they read their own writes
+def pin_to_primary(user_id):
+    state_cache.set(_pin_key(user_id), True, settings.REPLICA_PIN_SECONDS)
+
+
+def replica_alias_for(user_id):
+    if REPLICA_ALIAS not in settings.DATABASES or is_pinned(user_id):
+        return None
+    return REPLICA_ALIAS
+
+
+# Read the primary while filling a versioned cache entry if the user got pinned after
+# the view picked the replica: a version was just bumped and the replica may lag it
+@contextmanager
+def primary_if_pinned(user_id):
+    if _read_alias.get() is None or not is_pinned(user_id):
+        yield
+        return
+    token = _read_alias.set(None)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+# Route a view's reads to the replica unless the user has just written something
+def analytics_read(view):
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            user = await request.auser()
+            alias = await sync_to_async(replica_alias_for)(user.pk)
+            token = _read_alias.set(alias)
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _read_alias.reset(token)
+    else:
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            token = _read_alias.set(replica_alias_for(request.user.pk))
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                _read_alias.reset(token)
+    return wrapper
+
+
+def _pin_after_write(request):
+    if request.method not in SAFE_METHODS and request.user.is_authenticated:
+        pin_to_primary(request.user.pk)
+
+
+# Pin users to the primary after any unsafe request
+@sync_and_async_middleware
+def replica_pin_middleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            response = await get_response(request)
+            await sync_to_async(_pin_after_write)(request)
+            return response
+    else:
+        def middleware(request):
+            response = get_response(request)
+            _pin_after_write(request)
+            return response
+    return middleware
@@ -0,0 +1,134 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from .goals import on_run_deleted, on_run_saved
+from .models import HeartRateStream, Run, PlannedRun, Tag, Tombstone, TrainingPlan
+from .versioning import bump_version
+from .zone_time import enqueue_zone_weeks
+
+
+SYNC_MODELS = {Run: "run", PlannedRun: "planned_run"}
+ZONE_TIME_FIELDS = ("date", "distance_km", "pace_min_km", "heart_rate", "zone")
+
+
+# Delete cascading from a user or a queryset of users
+def _account_deleted(origin):
+    return isinstance(origin, User) or (isinstance(origin, QuerySet) and origin.model is User)
+
+
+# Leave a tombstone so offline clients learn about the deletion
+@receiver(post_delete, sender=Run)
+@receiver(post_delete, sender=PlannedRun)
+def record_tombstone(sender, instance, origin=None, **kwargs):
+    # whole account is going away, tombstones would be deleted with it
+    if _account_deleted(origin):
+        return
+    Tombstone.objects.create(user_id=instance.user_id, model=SYNC_MODELS[sender], object_id=instance.pk)
+
+
+# Tag changes modify the run as far as sync is concerned
+@receiver(m2m_changed, sender=Run.tags.through)
+def touch_run_on_tag_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        run_ids = [instance.pk]
+    elif action == "pre_clear":
+        instance._cleared_run_ids = list(instance.runs.values_list("id", flat=True))
+        return
+    elif action == "post_clear":
+        run_ids = getattr(instance, "_cleared_run_ids", [])
+    else:
+        run_ids = pk_set or []
+    if action in ("post_add", "post_remove", "post_clear") and run_ids:
+        Run.objects.filter(pk__in=run_ids).update(updated_at=timezone.now())
+        # runs and tags share the owner
+        bump_version(instance.user_id, "runs")
+
+
+# Invalidate caches derived from a user's runs, per year for yearly views
+@receiver(post_save, sender=Run)
+@receiver(post_delete, sender=Run)
+def bump_run_versions(sender, instance, **kwargs):
+    years = {instance.date.year}
+    loaded = getattr(instance, "_loaded_values", {})
+    if loaded.get("date"):
+        years.add(loaded["date"].year)
+    bump_version(instance.user_id, "runs", *(f"runs:{y}" for y in sorted(years)))
+
+
+# Keep weekly and monthly goal counters in step with the runs
+@receiver(post_save, sender=Run)
+def count_saved_run(sender, instance, created, **kwargs):
+    on_run_saved(instance, created)
+
+
+@receiver(post_delete, sender=Run)
+def count_deleted_run(sender, instance, origin=None, **kwargs):
+    # totals go away with the account
+    if _account_deleted(origin):
+        return
+    on_run_deleted(instance)
+
+
+# Weekly time in zone is rebuilt by the worker for the weeks a change touches. A
+# run with an HR stream is counted from the stream (its own signals below), so
+# only a new date matters; without one the estimate fields do too.
+@receiver(post_save, sender=Run)
+def queue_zone_weeks_on_save(sender, instance, created, **kwargs):
+    loaded = getattr(instance, "_loaded_values", {})
+    if not created:
+        changed = {
+            f for f in ZONE_TIME_FIELDS
+            if f not in loaded or Run._meta.get_field(f).to_python(getattr(instance, f)) != loaded[f]
+        }
+        if not changed:
+            return
+        if "date" not in changed and HeartRateStream.objects.filter(run_id=instance.pk).exists():
+            return
+    dates = {instance.date, loaded.get("date") or instance.date}
+    transaction.on_commit(lambda: enqueue_zone_weeks(instance.user_id, dates))
+
+
+@receiver(post_delete, sender=Run)
+@receiver(post_save, sender=HeartRateStream)
+@receiver(post_delete, sender=HeartRateStream)
+def queue_zone_weeks(sender, instance, origin=None, **kwargs):
+    if _account_deleted(origin):
+        return
+    run_date = instance.date if sender is Run else Run.objects.filter(pk=instance.run_id).values_list("date", flat=True).first()
+    if run_date is not None:
+        transaction.on_commit(lambda: enqueue_zone_weeks(instance.user_id, [run_date]))
+
+
+# Connected last: a second save of the same instance compares against these values
+@receiver(post_save, sender=Run)
+def remember_saved_values(sender, instance, **kwargs):
+    instance._loaded_values = {f.attname: getattr(instance, f.attname) for f in instance._meta.concrete_fields}
+
+
+# Renaming or deleting a tag changes how its runs look
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def touch_runs_of_tag(sender, instance, created=False, **kwargs):
+    if created:
+        return
+    if Run.objects.filter(tags=instance).update(updated_at=timezone.now()):
+        bump_version(instance.user_id, "runs")
+
+
+# Synced planned runs carry their plan's name, so a plan edit modifies them
+@receiver(post_save, sender=TrainingPlan)
+def touch_planned_runs_of_plan(sender, instance, created, **kwargs):
+    if not created:
+        PlannedRun.objects.filter(plan=instance).update(updated_at=timezone.now())
+
+
+# Planned-run feeds change with the runs and with the names of their plans
+@receiver(post_save, sender=PlannedRun)
+@receiver(post_delete, sender=PlannedRun)
+@receiver(post_save, sender=TrainingPlan)
+@receiver(post_delete, sender=TrainingPlan)
+def bump_planned_version(sender, instance, **kwargs):
+    bump_version(instance.user_id, "planned")
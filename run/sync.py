@@ -0,0 +1,139 @@
+from datetime import datetime, timedelta
+from django.core import signing
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import Run, PlannedRun, Tombstone
+
+
+SYNC_TOKEN_SALT = "run.sync"
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 500
+# updated_at is stamped before commit, a row may become visible after a sync has
+# already moved past its timestamp; windows stop this far behind now
+COMMIT_MARGIN = timedelta(seconds=60)
+# tombstones older than this are pruned; a client that last synced before then
+# gets a full download (page["full"]) instead of a delta
+TOMBSTONE_RETENTION = timedelta(days=90)
+
+RUN_FIELDS = ["id", "date", "start_time", "run_type", "distance_km", "pace_min_km", "heart_rate", "zone", "notes", "updated_at"]
+PLANNED_FIELDS = ["id", "plan_id", "date", "run_type", "distance_km", "pace_target", "notes", "updated_at"]
+
+
+class SyncTokenError(ValueError):
+    pass
+
+
+# Changed runs, changed planned runs and tombstones, each keyset-paginated on (timestamp, id)
+def _phases(user, since, until):
+    phases = [
+        ("runs", "updated_at", Run.objects.filter(user=user).values(*RUN_FIELDS)),
+        ("planned_runs", "updated_at", PlannedRun.objects.filter(user=user).values(*PLANNED_FIELDS, plan_name=F("plan__name"))),
+    ]
+    # a full download has nothing to delete on the client
+    if since is not None:
+        phases.append(("deleted", "deleted_at", Tombstone.objects.filter(user=user).values("model", "object_id", "deleted_at", "id")))
+
+    for key, ts_field, qs in phases:
+        qs = qs.filter(**{f"{ts_field}__lte": until})
+        if since is not None:
+            qs = qs.filter(**{f"{ts_field}__gt": since})
+        yield key, ts_field, qs.order_by(ts_field, "id")
+
+
+def _dump(payload: dict) -> str:
+    return signing.dumps(payload, salt=SYNC_TOKEN_SALT, compress=True)
+
+
+def _load(token: str) -> dict:
+    try:
+        payload = signing.loads(token, salt=SYNC_TOKEN_SALT)
+    except signing.BadSignature:
+        raise SyncTokenError("Invalid sync token")
+    if not isinstance(payload, dict):
+        raise SyncTokenError("Invalid sync token")
+    return payload
+
+
+def _parse_ts(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+# Attach tag names to a page of runs with one query
+def _attach_tags(runs):
+    by_run = {r["id"]: r for r in runs}
+    for r in runs:
+        r["tags"] = []
+    links = Run.tags.through.objects.filter(run_id__in=by_run).values_list("run_id", "tag__name").order_by("tag__name")
+    for run_id, name in links:
+        by_run[run_id]["tags"].append(name)
+
+
+# Delete tombstones past the retention period; returns how many went
+def prune_tombstones(now=None) -> int:
+    cutoff = (now or timezone.now()) - TOMBSTONE_RETENTION
+    deleted, _ = Tombstone.objects.filter(deleted_at__lt=cutoff).delete()
+    return deleted
+
+
+# Build one page of changes for the client
+#
+# The first page pins an upper bound ("until") so that paging runs over a stable
+# window; rows changed meanwhile are picked up by the next sync. The bound lags
+# COMMIT_MARGIN behind now so transactions still open have committed by then.
+# The token of the last page only carries the new lower bound. A full download
+# (first sync or a token past TOMBSTONE_RETENTION) replaces the client's copy.
+def build_sync_page(user, token=None, limit=None):
+    try:
+        limit = int(limit) if limit else DEFAULT_PAGE_SIZE
+    except ValueError:
+        limit = DEFAULT_PAGE_SIZE
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    state = _load(token) if token else {}
+    try:
+        since = _parse_ts(state.get("s"))
+        until = _parse_ts(state.get("u")) or timezone.now() - COMMIT_MARGIN
+        phase = int(state.get("p", 0))
+        cursor_ts = _parse_ts(state.get("t"))
+        cursor_id = int(state.get("i", 0))
+    except (TypeError, ValueError):
+        raise SyncTokenError("Invalid sync token")
+    # deletions before the retention cutoff may be gone, only a full download is safe
+    if since is not None and "u" not in state and since < timezone.now() - TOMBSTONE_RETENTION:
+        since = None
+
+    page = {"full": since is None, "runs": [], "planned_runs": [], "deleted": []}
+    remaining = limit
+    for index, (key, ts_field, qs) in enumerate(_phases(user, since, until)):
+        if index < phase:
+            continue
+        if index > phase:
+            cursor_ts, cursor_id = None, 0
+        if cursor_ts is not None:
+            qs = qs.filter(Q(**{f"{ts_field}__gt": cursor_ts}) | Q(**{ts_field: cursor_ts, "id__gt": cursor_id}))
+        rows = list(qs[:remaining])
+        remaining -= len(rows)
+        if rows:
+            cursor_ts, cursor_id = rows[-1][ts_field], rows[-1]["id"]
+        if key == "deleted":
+            rows = [{"model": r["model"], "id": r["object_id"]} for r in rows]
+        page[key] = rows
+        if remaining == 0:
+            phase = index
+            break
+    else:
+        _attach_tags(page["runs"])
+        page["has_more"] = False
+        page["next"] = _dump({"s": until.isoformat()})
+        return page
+
+    _attach_tags(page["runs"])
+    page["has_more"] = True
+    page["next"] = _dump({
+        "s": since.isoformat() if since else None,
+        "u": until.isoformat(),
+        "p": phase,
+        "t": cursor_ts.isoformat(),
+        "i": cursor_id,
+    })
+    return page
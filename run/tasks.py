@@ -0,0 +1,27 @@
+from datetime import date as _date
+from .importer import import_runs_csv
+from .jobs import job_handler, report_progress
+from .zone_time import update_zone_weeks
+from .zones import reclassify_runs
+
+
+# Handlers for background jobs, registered when the app is ready; long ones report
+# progress, which also keeps requeue_stale_jobs from taking them back
+
+
+@job_handler("reclassify_zones")
+def reclassify_zones_job(job):
+    reclassify_runs(job.user_id, progress=lambda done, total: report_progress(job, done, total))
+
+
+@job_handler("import_runs")
+def import_runs_job(job):
+    result = import_runs_csv(job.user_id, job.payload["csv"], progress=lambda done: report_progress(job, done))
+    # kept for the status endpoint, the uploaded data is dropped
+    return result.as_dict()
+
+
+@job_handler("zone_weeks")
+def zone_weeks_job(job):
+    weeks = None if job.payload.get("all") else [_date.fromisoformat(w) for w in job.payload["weeks"]]
+    update_zone_weeks(job.user_id, weeks, progress=lambda done: report_progress(job, done))
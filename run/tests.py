@@ -1,11 +1,27 @@
 import pytest
-from datetime import date
+from datetime import date, timedelta
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import User
+from django.core.cache import caches
 from run.models import Run, Profile, TrainingPlan, PlannedRun, ensure_default_zones, Tag
 
 
+# cached versions and fragments must not leak between tests; an in-memory cache
+# keeps the query counts below about the app's own queries
+@pytest.fixture(autouse=True)
+def clear_cache(settings):
+    settings.CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "state": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "state"},
+    }
+    for alias in settings.CACHES:
+        caches[alias].clear()
+    yield
+    for alias in settings.CACHES:
+        caches[alias].clear()
+
+
 # test home returns 200
 @pytest.mark.django_db
 def test_home_ok(client):
@@ -295,3 +311,1017 @@ def test_calendar_view_auth_with_item(client):
     assert resp.status_code == 200
     body = resp.content.decode()
     assert "My Calendar Plan" in body
+
+
+# first sync returns everything, next sync only what changed
+@pytest.mark.django_db
+def test_sync_returns_only_changes(client, monkeypatch):
+    monkeypatch.setattr("run.sync.COMMIT_MARGIN", timedelta(0))
+    u = User.objects.create_user(username="patriktest15", password="patriktest15")
+    client.login(username="patriktest15", password="patriktest15")
+    r1 = Run.objects.create(user=u, date=date(2025, 8, 1), run_type="EASY", distance_km=5.0, pace_min_km="6:00")
+    r2 = Run.objects.create(user=u, date=date(2025, 8, 2), run_type="EASY", distance_km=6.0, pace_min_km="5:50")
+
+    data = client.get(reverse("sync")).json()
+    assert {r["id"] for r in data["runs"]} == {r1.id, r2.id}
+    assert data["has_more"] is False
+
+    r1.notes = "edited"
+    r1.save()
+    r2_id = r2.id
+    r2.delete()
+    data = client.get(reverse("sync"), {"since": data["next"]}).json()
+    assert [r["id"] for r in data["runs"]] == [r1.id]
+    assert data["deleted"] == [{"model": "run", "id": r2_id}]
+    assert data["full"] is False
+
+    # renaming a plan resends its planned runs with the new name
+    plan = TrainingPlan.objects.create(user=u, name="Base")
+    planned = PlannedRun.objects.create(user=u, plan=plan, date=date(2025, 9, 1), run_type="LONG")
+    data = client.get(reverse("sync"), {"since": data["next"]}).json()
+    plan.name = "Build"
+    plan.save()
+    data = client.get(reverse("sync"), {"since": data["next"]}).json()
+    assert [(p["id"], p["plan_name"]) for p in data["planned_runs"]] == [(planned.id, "Build")]
+
+    # tombstones past the retention are pruned, older tokens get a full download
+    from run.models import Tombstone
+    from run.sync import prune_tombstones
+
+    assert prune_tombstones() == 0
+    monkeypatch.setattr("run.sync.TOMBSTONE_RETENTION", timedelta(0))
+    assert prune_tombstones() == 1 and not Tombstone.objects.filter(user=u).exists()
+    data = client.get(reverse("sync"), {"since": data["next"]}).json()
+    assert data["full"] is True
+    assert {r["id"] for r in data["runs"]} == {r1.id}
+
+
+# sync pages through changes with the returned token
+@pytest.mark.django_db
+def test_sync_pages(client, monkeypatch):
+    monkeypatch.setattr("run.sync.COMMIT_MARGIN", timedelta(0))
+    u = User.objects.create_user(username="patriktest16", password="patriktest16")
+    client.login(username="patriktest16", password="patriktest16")
+    for day in range(1, 6):
+        Run.objects.create(user=u, date=date(2025, 8, day), run_type="EASY", distance_km=5.0, pace_min_km="6:00")
+    PlannedRun.objects.create(user=u, date=date(2025, 9, 1), run_type="LONG")
+
+    seen, token = [], None
+    while True:
+        params = {"limit": 2}
+        if token:
+            params["since"] = token
+        data = client.get(reverse("sync"), params).json()
+        seen += [("run", r["id"]) for r in data["runs"]] + [("planned", p["id"]) for p in data["planned_runs"]]
+        token = data["next"]
+        if not data["has_more"]:
+            break
+    assert len(seen) == 6 == len(set(seen))
+
+    assert client.get(reverse("sync"), {"since": "garbage"}).status_code == 400
+
+
+# a sync window ends a margin before now; rows stamped inside the margin, which may
+# not have committed yet, come with the next sync
+@pytest.mark.django_db
+def test_sync_window_lags_behind_commits(client, monkeypatch):
+    from django.utils import timezone
+    from run.sync import COMMIT_MARGIN
+
+    u = User.objects.create_user(username="patriktest46", password="patriktest46")
+    client.login(username="patriktest46", password="patriktest46")
+    old = Run.objects.create(user=u, date=date(2025, 8, 1), run_type="EASY", distance_km=5.0, pace_min_km="6:00")
+    Run.objects.filter(pk=old.pk).update(updated_at=timezone.now() - 2 * COMMIT_MARGIN)
+    recent = Run.objects.create(user=u, date=date(2025, 8, 2), run_type="EASY", distance_km=6.0, pace_min_km="5:50")
+
+    data = client.get(reverse("sync")).json()
+    assert [r["id"] for r in data["runs"]] == [old.id]
+
+    real_now = timezone.now
+    monkeypatch.setattr(timezone, "now", lambda: real_now() + 2 * COMMIT_MARGIN)
+    data = client.get(reverse("sync"), {"since": data["next"]}).json()
+    assert [r["id"] for r in data["runs"]] == [recent.id]
+
+
+# dashboard gathers volume, records and plan for the logged-in user
+@pytest.mark.django_db(transaction=True, databases=["default", "replica"])
+def test_dashboard_view(client):
+    u = User.objects.create_user(username="patriktest17", password="patriktest17")
+    client.login(username="patriktest17", password="patriktest17")
+    Run.objects.create(user=u, date=date.today(), run_type="EASY", distance_km=12.5, pace_min_km="5:10")
+    Run.objects.create(user=u, date=date.today(), run_type="TEMPO", distance_km=8.0, pace_min_km="4:20")
+    PlannedRun.objects.create(user=u, date=date.today(), run_type="LONG", distance_km=21.0)
+
+    resp = client.get(reverse("dashboard"))
+    assert resp.status_code == 200
+    assert resp.context["volume"]["week_km"] == 20.5
+    assert resp.context["prs"]["longest"]["distance_km"] == 12.5
+    assert resp.context["prs"]["fastest"]["pace_min_km"] == "4:20"
+    assert len(resp.context["week_plan"]) == 1
+
+    from asgiref.sync import async_to_sync
+    from run.dashboard import aload_dashboard, load_dashboard
+
+    assert async_to_sync(aload_dashboard)(u.pk) == load_dashboard(u.pk)
+
+
+# heatmap sums runs per day and per type for the chosen year
+@pytest.mark.django_db(transaction=True, databases=["default", "replica"])
+def test_heatmap_year_totals(client):
+    u = User.objects.create_user(username="patriktest18", password="patriktest18")
+    client.login(username="patriktest18", password="patriktest18")
+    Run.objects.create(user=u, date=date(2023, 3, 1), run_type="EASY", distance_km=5.0, pace_min_km="6:00")
+    Run.objects.create(user=u, date=date(2023, 3, 1), run_type="TEMPO", distance_km=7.0, pace_min_km="4:40")
+    Run.objects.create(user=u, date=date(2024, 3, 1), run_type="EASY", distance_km=9.0, pace_min_km="6:00")
+
+    resp = client.get(reverse("heatmap"), {"year": 2023})
+    assert resp.status_code == 200
+    review = resp.context["review"]
+    assert review["total_km"] == 12.0
+    assert review["active_days"] == 1
+    assert {t["run_type"] for t in review["type_totals"]} == {"Easy", "Tempo"}
+    assert "2023-03-01: 12.0 km" in resp.content.decode()
+
+
+# cached past year is refreshed after a backdated run is added
+@pytest.mark.django_db(transaction=True, databases=["default", "replica"])
+def test_heatmap_past_year_cache_invalidated(client):
+    u = User.objects.create_user(username="patriktest19", password="patriktest19")
+    client.login(username="patriktest19", password="patriktest19")
+    Run.objects.create(user=u, date=date(2022, 5, 1), run_type="EASY", distance_km=5.0, pace_min_km="6:00")
+    assert client.get(reverse("heatmap"), {"year": 2022}).context["review"]["total_km"] == 5.0
+
+    Run.objects.create(user=u, date=date(2022, 5, 2), run_type="EASY", distance_km=3.0, pace_min_km="6:00")
+    assert client.get(reverse("heatmap"), {"year": 2022}).context["review"]["total_km"] == 8.0
+    assert client.get(reverse("heatmap"), {"year": "abc"}).status_code == 400
+    assert client.get(reverse("heatmap"), {"year": 0}).status_code == 400
+    assert client.get(reverse("heatmap"), {"year": 9999}).status_code == 200
+    assert client.get(reverse("heatmap"), {"year": 1}).status_code == 200
+
+
+# charts bucket long ranges so the series stays bounded
+@pytest.mark.django_db(transaction=True, databases=["default", "replica"])
+def test_charts_are_bounded(client):
+    from run.charts import MAX_POINTS, bucket_for_range, heart_rate_series, lttb
+
+    u = User.objects.create_user(username="patriktest20", password="patriktest20")
+    client.login(username="patriktest20", password="patriktest20")
+    Run.objects.bulk_create([
+        Run(user=u, date=date(2015, 1, 1) + timedelta(days=i), run_type="EASY", distance_km=8.0,
+            pace_min_km="5:30", heart_rate=str(130 + i % 20))
+        for i in range(0, 3650, 3)
+    ])
+
+    assert bucket_for_range(date(2024, 1, 1), date(2024, 12, 31)) == "week"
+    assert bucket_for_range(date(2015, 1, 1), date(2024, 12, 31)) == "month"
+    points = [(date(2015, 1, 1) + timedelta(days=i), float(i % 7)) for i in range(1000)]
+    assert len(lttb(points)) == MAX_POINTS
+
+    resp = client.get(reverse("charts"), {"start": "2015-01-01", "end": "2024-12-31"})
+    assert resp.status_code == 200
+    charts = resp.context["charts"]
+    assert charts["bucket"] == "month"
+    assert charts["volume_svg"].count("<rect") <= MAX_POINTS
+    assert "<polyline" in charts["hr_svg"]
+
+    # heart rate is averaged per day in the database, ranges and junk included
+    Run.objects.create(user=u, date=date(2025, 3, 1), run_type="EASY", distance_km=5.0,
+                       pace_min_km="5:30", heart_rate="140-150")
+    Run.objects.create(user=u, date=date(2025, 3, 1), run_type="EASY", distance_km=5.0,
+                       pace_min_km="5:30", heart_rate="160")
+    Run.objects.create(user=u, date=date(2025, 3, 2), run_type="EASY", distance_km=5.0,
+                       pace_min_km="5:30", heart_rate="n/a")
+    assert heart_rate_series(u.id, date(2025, 3, 1), date(2025, 3, 31)) == [(date(2025, 3, 1), 152.5)]
+    assert len(heart_rate_series(u.id, date(2015, 1, 1), date(2024, 12, 31))) == MAX_POINTS
+
+
+# zone edits queue one reclassification job, which the worker runs
+@pytest.mark.django_db(transaction=True)
+def test_zone_reclassification_job(client):
+    from django.core.management import call_command
+    from run.jobs import enqueue
+    from run.models import Job
+
+    user = User.objects.create_user(username="patriktest21", password="patriktest21")
+    profile = Profile.objects.create(user=user)
+    ensure_default_zones(profile)
+    run = Run.objects.create(user=user, date=date(2025, 8, 1), run_type="EASY", distance_km=8.0,
+                             pace_min_km="5:40", heart_rate="150-156", zone="")
+
+    first = enqueue(user, "reclassify_zones")
+    assert enqueue(user, "reclassify_zones") == first
+    assert Job.objects.filter(user=user, kind="reclassify_zones").count() == 1
+
+    call_command("run_worker", "--once")
+    first.refresh_from_db()
+    run.refresh_from_db()
+    assert first.status == "done"
+    assert first.progress == first.progress_total == 1
+    assert run.zone == "Z3"
+
+
+# failing job is retried later and fails for good after max attempts
+@pytest.mark.django_db
+def test_job_retries_then_fails():
+    from run.jobs import JOB_HANDLERS, claim_next_job, enqueue, run_job
+
+    user = User.objects.create_user(username="patriktest22", password="patriktest22")
+    JOB_HANDLERS["explode"] = lambda job: 1 / 0
+    try:
+        job = enqueue(user, "explode", max_attempts=2)
+        assert run_job(claim_next_job()) is False
+        job.refresh_from_db()
+        assert job.status == "queued" and job.run_after > job.created_at
+        assert claim_next_job() is None
+
+        job.run_after = job.created_at
+        job.save()
+        run_job(claim_next_job())
+        job.refresh_from_db()
+        assert job.status == "failed"
+        assert "ZeroDivisionError" in job.error
+    finally:
+        del JOB_HANDLERS["explode"]
+
+
+# a done job keeps only its result, finished jobs are purged after the retention
+@pytest.mark.django_db
+def test_finished_jobs_drop_payload_and_get_purged():
+    from django.utils import timezone
+    from run.jobs import FINISHED_RETENTION, JOB_HANDLERS, claim_next_job, enqueue, purge_finished_jobs, run_job
+    from run.models import Job
+
+    user = User.objects.create_user(username="patriktest54", password="patriktest54")
+    JOB_HANDLERS["echo"] = lambda job: len(job.payload["data"])
+    try:
+        job = enqueue(user, "echo", {"data": "x" * 1000})
+        waiting = enqueue(user, "echo", {"data": "y"}, dedup_key="later")
+        assert run_job(claim_next_job()) is True
+        job.refresh_from_db()
+        assert job.payload == {"result": 1000}
+
+        later = timezone.now() + FINISHED_RETENTION + timedelta(minutes=1)
+        assert purge_finished_jobs(now=later) == 1
+        assert list(Job.objects.filter(user=user)) == [waiting]
+    finally:
+        del JOB_HANDLERS["echo"]
+
+
+# recompute command checkpoints finished users and skips them on a rerun of the same
+# steps; a checkpoint of other steps is refused
+@pytest.mark.django_db
+def test_recompute_command_checkpoint(tmp_path):
+    from django.core.management import call_command
+    from django.core.management.base import CommandError
+
+    users = [User.objects.create_user(username=f"patriktest23{i}", password="x") for i in range(3)]
+    for u in users:
+        ensure_default_zones(Profile.objects.create(user=u))
+        Run.objects.create(user=u, date=date(2025, 8, 1), run_type="EASY", distance_km=8.0,
+                           pace_min_km="5:40", heart_rate="120")
+
+    checkpoint = tmp_path / "recompute.txt"
+    call_command("recompute", "--workers", "1", "--steps", "zones", "--checkpoint", str(checkpoint))
+    assert set(Run.objects.values_list("zone", flat=True)) == {"Z1"}
+    header, *ids = checkpoint.read_text().splitlines()
+    assert header == "# steps: zones"
+    assert {int(x) for x in ids} >= {u.pk for u in users}
+
+    Run.objects.update(zone="")
+    call_command("recompute", "--workers", "1", "--steps", "zones", "--checkpoint", str(checkpoint))
+    assert set(Run.objects.values_list("zone", flat=True)) == {""}
+
+    with pytest.raises(CommandError, match="checkpoint of steps zones"):
+        call_command("recompute", "--workers", "1", "--checkpoint", str(checkpoint))
+
+
+# the process pool recomputes every user and checkpoints each one; forked workers
+# use their own connections, so the rows must be committed
+@pytest.mark.django_db(transaction=True)
+def test_recompute_command_process_pool(tmp_path):
+    from django.core.management import call_command
+
+    users = [User.objects.create_user(username=f"patriktest56{i}", password="x") for i in range(5)]
+    for u in users:
+        ensure_default_zones(Profile.objects.create(user=u))
+        Run.objects.create(user=u, date=date(2025, 8, 1), run_type="EASY", distance_km=8.0,
+                           pace_min_km="5:40", heart_rate="160")
+
+    checkpoint = tmp_path / "recompute.txt"
+    call_command("recompute", "--workers", "2", "--chunk-size", "2", "--steps", "zones", "--checkpoint", str(checkpoint))
+    assert set(Run.objects.values_list("zone", flat=True)) == {"Z4"}
+    header, *ids = checkpoint.read_text().splitlines()
+    assert header == "# steps: zones"
+    assert sorted(int(x) for x in ids) == sorted(u.pk for u in users)
+
+
+# run list filters by year and rejects years a date cannot hold
+@pytest.mark.django_db
+def test_run_list_year_filter(client):
+    u = User.objects.create_user(username="patriktest24", password="patriktest24")
+    client.login(username="patriktest24", password="patriktest24")
+    Run.objects.create(user=u, date=date(2024, 6, 3), run_type="EASY", distance_km=7.0, pace_min_km="5:45")
+    Run.objects.create(user=u, date=date(2025, 6, 3), run_type="LONG", distance_km=18.0, pace_min_km="5:55")
+
+    body = client.get(reverse("run_list"), {"year": 2025}).content.decode()
+    assert "2025-06-03" in body
+    assert "2024-06-03" not in body
+    assert client.get(reverse("run_list"), {"year": "x"}).status_code == 400
+    assert client.get(reverse("run_list"), {"year": 10000}).status_code == 400
+
+
+# partitioning is PostgreSQL only
+@pytest.mark.django_db
+def test_partition_runs_requires_postgres(monkeypatch):
+    from django.core.management import call_command
+    from django.core.management.base import CommandError
+    from django.db import connection
+
+    monkeypatch.setattr(connection, "vendor", "sqlite")
+    for action in ("convert", "create"):
+        with pytest.raises(CommandError, match="requires PostgreSQL"):
+            call_command("partition_runs", action)
+
+
+# a populated table keeps its rows, ids and tags when converted, and rows parked in
+# the default partition move out once their year gets a partition
+@pytest.mark.django_db
+def test_convert_populated_runs_table():
+    from django.db import connection
+    from run.partitioning import (
+        DEFAULT_PARTITION, convert_to_partitioned, create_future_partitions, existing_partition_years,
+        is_partitioned, partition_name,
+    )
+
+    if connection.vendor != "postgresql":
+        pytest.skip("partitioning is PostgreSQL only")
+    u = User.objects.create_user(username="patriktest44", password="patriktest44")
+    hills = Tag.objects.create(user=u, name="hills")
+    runs = [
+        Run.objects.create(user=u, date=date(year, 5, 1), run_type="EASY", distance_km=5 + i, pace_min_km="5:30")
+        for i, year in enumerate([2023, 2024, 2025, 2030])
+    ]
+    runs[0].tags.add(hills)
+    count = Run.objects.count()
+
+    def rows(cursor, table):
+        cursor.execute(f"SELECT count(*) FROM {connection.ops.quote_name(table)}")
+        return cursor.fetchone()[0]
+
+    with connection.cursor() as cursor:
+        # deferred FK checks of the rows above would block ALTER TABLE
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        convert_to_partitioned(years_ahead=1, today=date(2025, 1, 1))
+        assert is_partitioned(cursor)
+        assert existing_partition_years(cursor) == [2023, 2024, 2025, 2026]
+        assert rows(cursor, DEFAULT_PARTITION) == 1
+
+    assert Run.objects.count() == count
+    assert sorted(Run.objects.filter(user=u).values_list("id", flat=True)) == sorted(r.pk for r in runs)
+    assert list(Run.objects.get(pk=runs[0].pk).tags.values_list("name", flat=True)) == ["hills"]
+    new = Run.objects.create(user=u, date=date(2026, 2, 1), run_type="EASY", distance_km=12, pace_min_km="5:00")
+    assert new.pk > max(r.pk for r in runs)
+
+    assert create_future_partitions(years_ahead=5, today=date(2025, 1, 1)) == [2027, 2028, 2029, 2030]
+    with connection.cursor() as cursor:
+        assert rows(cursor, DEFAULT_PARTITION) == 0
+        assert rows(cursor, partition_name(2030)) == 1
+        assert rows(cursor, partition_name(2026)) == 1
+    assert Run.objects.get(pk=runs[3].pk).date == date(2030, 5, 1)
+
+
+# analytics reads use the replica until the user writes, then the primary for a while
+@pytest.mark.django_db(transaction=True, databases=["default", "replica"])
+def test_replica_routing_and_pinning(client, monkeypatch):
+    from run import heatmap
+    from run.routers import ReplicaRouter, is_pinned
+
+    u = User.objects.create_user(username="patriktest25", password="patriktest25")
+    client.login(username="patriktest25", password="patriktest25")
+    seen = []
+    real = heatmap.year_activity
+
+    def spy(user_id, year):
+        seen.append(ReplicaRouter().db_for_read(Run))
+        return real(user_id, year)
+
+    monkeypatch.setattr(heatmap, "year_activity", spy)
+    client.get(reverse("heatmap"), {"year": 2020})
+    assert not is_pinned(u.pk)
+    client.post(reverse("run_create"), data={
+        "date": date(2020, 8, 15), "run_type": "EASY", "distance_km": "10.0", "pace_min_km": "5:30",
+    })
+    assert is_pinned(u.pk)
+    resp = client.get(reverse("heatmap"), {"year": 2020})
+    assert seen == ["replica", None]
+    assert resp.context["review"]["total_km"] == 10.0
+
+
+# any version bump pins the user, worker writes included, and a cache fill that
+# started on the replica switches to the primary once the user is pinned
+@pytest.mark.django_db
+def test_version_bump_pins_to_primary(django_capture_on_commit_callbacks):
+    from run.routers import ReplicaRouter, _read_alias, is_pinned, primary_if_pinned
+    from run.versioning import bump_version
+
+    u = User.objects.create_user(username="patriktest43", password="patriktest43")
+    token = _read_alias.set("replica")
+    try:
+        with primary_if_pinned(u.pk):
+            assert ReplicaRouter().db_for_read(Run) == "replica"
+        with django_capture_on_commit_callbacks(execute=True):
+            bump_version(u.pk, "runs")
+        assert is_pinned(u.pk)
+        with primary_if_pinned(u.pk):
+            assert ReplicaRouter().db_for_read(Run) is None
+        assert ReplicaRouter().db_for_read(Run) == "replica"
+    finally:
+        _read_alias.reset(token)
+
+
+# the shared database cache is always read from the primary, even in analytics views
+def test_database_cache_reads_primary():
+    from django.core.cache.backends.db import DatabaseCache
+    from run.routers import ReplicaRouter, _read_alias
+
+    entry = DatabaseCache("pacepower_cache", {}).cache_model_class
+    token = _read_alias.set("replica")
+    try:
+        assert ReplicaRouter().db_for_read(entry) == "default"
+        assert ReplicaRouter().db_for_read(Run) == "replica"
+    finally:
+        _read_alias.reset(token)
+
+
+# replica pins live in their own cache, so culling rendered fragments cannot drop them
+@pytest.mark.django_db
+def test_pins_survive_fragment_cache_cull(settings):
+    from run.routers import is_pinned, pin_to_primary
+
+    settings.CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.db.DatabaseCache", "LOCATION": "pacepower_cache",
+                    "OPTIONS": {"MAX_ENTRIES": 5, "CULL_FREQUENCY": 2}},
+        "state": {"BACKEND": "django.core.cache.backends.db.DatabaseCache", "LOCATION": "pacepower_state_cache"},
+    }
+    u = User.objects.create_user(username="patriktest52", password="patriktest52")
+    pin_to_primary(u.pk)
+    caches["default"].set_many({f"run-row:{n}": "<tr></tr>" for n in range(20)})
+    caches["default"].set("run-row:last", "<tr></tr>")
+    assert is_pinned(u.pk)
+
+
+# run rows come from the cache and are re-rendered after an edit or tag rename
+@pytest.mark.django_db
+def test_run_list_row_fragments(client, django_assert_max_num_queries):
+    u = User.objects.create_user(username="patriktest26", password="patriktest26")
+    client.login(username="patriktest26", password="patriktest26")
+    tag = Tag.objects.create(user=u, name="hills")
+    runs = [Run.objects.create(user=u, date=date(2025, 7, day), run_type="EASY", distance_km=5.0 + day,
+                               pace_min_km="5:30") for day in range(1, 21)]
+    runs[0].tags.add(tag)
+
+    assert "hills" in client.get(reverse("run_list")).content.decode()
+    with django_assert_max_num_queries(5):
+        client.get(reverse("run_list"))
+
+    tag.name = "hill repeats"
+    tag.save()
+    runs[1].distance_km = 42.2
+    runs[1].save()
+    body = client.get(reverse("run_list")).content.decode()
+    assert "hill repeats" in body
+    assert "42.2 km" in body
+    assert body.count(" km @ ") == 20
+
+    # a run edited after the page's version query is rendered as it is now
+    from run.fragments import render_run_rows
+
+    stale = [(r.pk, r.updated_at) for r in Run.objects.filter(user=u).order_by("-date")[:3]]
+    Run.objects.filter(pk=stale[1][0]).update(distance_km=30.5, updated_at=stale[1][1] + timedelta(seconds=1))
+    caches["default"].clear()
+    rows = render_run_rows(stale)
+    assert len(rows) == 3 and "30.5 km" in rows[1]
+
+
+# calendar feed lists planned runs and answers 304 without queries when unchanged
+@pytest.mark.django_db(transaction=True)
+def test_planned_run_ics_feed(client, django_assert_num_queries):
+    from run.ical import feed_etag, feed_last_modified, feed_token
+
+    u = User.objects.create_user(username="patriktest27", password="patriktest27")
+    plan = TrainingPlan.objects.create(user=u, name="Marathon, spring")
+    PlannedRun.objects.create(user=u, plan=plan, date=date.today() + timedelta(days=3), run_type="LONG",
+                              distance_km=30.0, pace_target="5:20")
+    url = reverse("planned_ics", args=[feed_token(u.pk)])
+
+    resp = client.get(url)
+    assert resp.status_code == 200
+    body = b"".join(resp.streaming_content).decode()
+    assert "SUMMARY:Long 30 km" in body
+    assert "Marathon\\, spring" in body
+
+    with django_assert_num_queries(0):
+        assert client.get(url, HTTP_IF_NONE_MATCH=resp["ETag"]).status_code == 304
+
+    PlannedRun.objects.create(user=u, date=date.today(), run_type="EASY")
+    assert client.get(url, HTTP_IF_NONE_MATCH=resp["ETag"]).status_code == 200
+    assert client.get(reverse("planned_ics", args=["1:forged"])).status_code == 404
+
+    # the window moves at midnight even without plan changes
+    tomorrow = date.today() + timedelta(days=1)
+    assert feed_etag(u.pk, tomorrow) != feed_etag(u.pk)
+    assert feed_last_modified(u.pk, tomorrow) > feed_last_modified(u.pk)
+
+
+# admin changelists load without counting the whole table
+@pytest.mark.django_db
+def test_admin_run_changelist(admin_client, monkeypatch):
+    u = User.objects.create_user(username="patriktest28", password="patriktest28")
+    Run.objects.create(user=u, date=date(2025, 8, 1), run_type="EASY", distance_km=5.0, pace_min_km="6:00")
+    PlannedRun.objects.create(user=u, date=date(2025, 8, 2), run_type="EASY")
+
+    resp = admin_client.get(reverse("admin:run_run_changelist"))
+    assert resp.status_code == 200
+    assert "patriktest28" in resp.content.decode()
+    assert admin_client.get(reverse("admin:run_run_changelist"), {"date__gte": "2025-01-01"}).status_code == 200
+    assert admin_client.get(reverse("admin:run_plannedrun_changelist")).status_code == 200
+    autocomplete = {"app_label": "run", "model_name": "run", "field_name": "tags", "term": "x"}
+    assert admin_client.get(reverse("admin:autocomplete"), autocomplete).status_code == 200
+
+    # filtered counts are exact below the cap and fall back to the planner past it
+    from run.admin import EstimatedCountPaginator, estimated_query_rows
+
+    for day in range(2, 6):
+        Run.objects.create(user=u, date=date(2025, 8, day), run_type="EASY", distance_km=5.0 + day, pace_min_km="6:00")
+    filtered = Run.objects.filter(date__gte=date(2025, 1, 1)).order_by("-date", "-id")
+    assert EstimatedCountPaginator(filtered, 2).count == 5
+    monkeypatch.setattr("run.admin.FILTERED_COUNT_CAP", 3)
+    assert isinstance(estimated_query_rows(filtered), int)
+    assert EstimatedCountPaginator(filtered, 2).count == max(3, estimated_query_rows(filtered))
+
+    # the same run may be added again by hand, but editing an imported run into a copy
+    # of another imported one is a form error, not an IntegrityError
+    from run.importer import import_runs_csv
+
+    duplicate = {"user": u.pk, "date": "2025-08-01", "run_type": "EASY", "distance_km": "5.0", "pace_min_km": "6:00"}
+    assert admin_client.post(reverse("admin:run_run_add"), duplicate).status_code == 302
+    import_runs_csv(u.pk, "date,run_type,distance_km,pace_min_km\n2025-08-03,EASY,5,6:00\n2025-08-03,EASY,6,6:00\n")
+    edited = Run.objects.get(user=u, date=date(2025, 8, 3), distance_km=6)
+    resp = admin_client.post(reverse("admin:run_run_change", args=[edited.pk]), dict(duplicate, date="2025-08-03"))
+    assert resp.status_code == 200 and "already exists" in resp.content.decode()
+
+
+# laps typed on the form are stored in bulk and summarised on the detail page
+@pytest.mark.django_db
+def test_run_create_with_laps_and_detail_splits(client):
+    u = User.objects.create_user(username="patriktest29", password="patriktest29")
+    client.login(username="patriktest29", password="patriktest29")
+    form_data = {
+        "date": date(2025, 8, 23),
+        "run_type": "INTERVAL",
+        "distance_km": "3.0",
+        "pace_min_km": "4:00",
+        "laps": "1.0 3:58 170\n1 4:05\n1,0 3:49 176",
+    }
+    resp = client.post(reverse("run_create"), data=form_data)
+    assert resp.status_code in (301, 302)
+    run = Run.objects.get(user=u, date=date(2025, 8, 23))
+    assert list(run.laps.values_list("number", "duration_seconds")) == [(1, 238), (2, 245), (3, 229)]
+
+    resp = client.get(reverse("run_detail", args=[run.pk]))
+    assert resp.context["splits"]["fastest"] == {"number": 3, "pace": "3:49"}
+    assert resp.context["best_rep"]["time"] == "3:49"
+
+    bad = dict(form_data, date=date(2025, 8, 24), laps="fast lap")
+    assert client.post(reverse("run_create"), data=bad).status_code == 200
+
+
+# re-importing the same rows creates nothing and reports them as skipped
+@pytest.mark.django_db
+def test_import_runs_skips_duplicates(monkeypatch):
+    from run.importer import import_runs_csv
+
+    u = User.objects.create_user(username="patriktest30", password="patriktest30")
+    text = (
+        "date,run_type,distance_km,pace_min_km,heart_rate,zone,notes,start_time\n"
+        "2025-06-01,EASY,8.0,5:40,142,Z2,,07:15\n"
+        "2025-06-01,EASY,8.00,5:40,142,Z2,second device,07:15\n"
+        "2025-06-02,TEMPO,10,4:35,,,,\n"
+        "2025-06-03,SWIM,1,2:00,,,,\n"
+        "2025-06-04,EASY,inf,5:00,,,,\n"
+        "2025-06-05,EASY,nan,5:00,,,,\n"
+    )
+    first = import_runs_csv(u.pk, text)
+    assert (first.created, first.skipped, first.invalid) == (2, 1, 3)
+
+    again = import_runs_csv(u.pk, text)
+    assert (again.created, again.skipped) == (0, 3)
+    assert Run.objects.filter(user=u).count() == 2
+
+    # a row another import inserts after the lookup is skipped, not counted
+    from run import importer
+    from run.models import PeriodTotal
+
+    insert_new = importer._insert_new
+
+    def concurrent_insert(runs):
+        Run.objects.bulk_create([Run(**{f.attname: getattr(runs[0], f.attname) for f in Run._meta.concrete_fields})])
+        return insert_new(runs)
+
+    monkeypatch.setattr(importer, "_insert_new", concurrent_insert)
+    totals = list(PeriodTotal.objects.filter(user=u).order_by("period", "period_start").values_list("period", "distance_km", "runs"))
+    raced = import_runs_csv(u.pk, "date,run_type,distance_km,pace_min_km\n2025-06-07,LONG,18,5:30\n")
+    assert (raced.created, raced.skipped) == (0, 1)
+    assert list(PeriodTotal.objects.filter(user=u).order_by("period", "period_start").values_list("period", "distance_km", "runs")) == totals
+
+
+# runs logged by hand are fingerprinted too, so an import skips them, but the same
+# run may be logged twice by hand
+@pytest.mark.django_db
+def test_manual_runs_are_fingerprinted(client):
+    from run.importer import import_runs_csv
+
+    u = User.objects.create_user(username="patriktest41", password="patriktest41")
+    client.login(username="patriktest41", password="patriktest41")
+    form_data = {"date": date(2025, 6, 4), "run_type": "EASY", "distance_km": "7.5", "pace_min_km": "5:50"}
+    assert client.post(reverse("run_create"), data=form_data).status_code == 302
+    run = Run.objects.get(user=u)
+    assert run.fingerprint == run.compute_fingerprint() != ""
+
+    assert client.post(reverse("run_create"), data=form_data).status_code == 302
+    assert Run.objects.filter(user=u, fingerprint=run.fingerprint).count() == 2
+
+    result = import_runs_csv(u.pk, "date,run_type,distance_km,pace_min_km\n2025-06-04,EASY,7.5,5:50\n")
+    assert (result.created, result.skipped) == (0, 1)
+
+    run.distance_km = 8
+    run.save(update_fields=["distance_km"])
+    run.refresh_from_db()
+    assert run.fingerprint == run.compute_fingerprint()
+
+
+# uploaded CSV is imported by the worker and the result is reported on the job
+@pytest.mark.django_db(transaction=True)
+def test_run_import_upload_queues_job(client):
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from django.core.management import call_command
+
+    u = User.objects.create_user(username="patriktest31", password="patriktest31")
+    client.login(username="patriktest31", password="patriktest31")
+    upload = SimpleUploadedFile("runs.csv", b"date,run_type,distance_km,pace_min_km\n2025-05-01,LONG,21.1,5:50\n")
+    resp = client.post(reverse("run_import"), {"file": upload})
+    job = resp.context["job"]
+
+    call_command("run_worker", "--once")
+    status = client.get(reverse("job_status", args=[job.pk])).json()
+    assert status["status"] == "done"
+    assert status["result"]["created"] == 1
+    assert Run.objects.filter(user=u, distance_km=21.1).exists()
+    # the handler heartbeats, so a long import is not taken for a stale job
+    job.refresh_from_db()
+    assert job.progress == 1
+
+
+# goal counters follow creates, edits, deletes and imports; reconcile fixes drift
+@pytest.mark.django_db
+def test_period_totals_incremental_and_reconcile():
+    from django.core.management import call_command
+    from run.goals import reconcile_user
+    from run.importer import import_runs_csv
+    from run.models import PeriodTotal
+
+    u = User.objects.create_user(username="patriktest32", password="patriktest32")
+
+    def total(period, start):
+        row = PeriodTotal.objects.filter(user=u, period=period, period_start=start).first()
+        return (round(row.distance_km, 2), row.runs) if row else (0, 0)
+
+    run = Run.objects.create(user=u, date=date(2025, 6, 4), run_type="EASY", distance_km=8, pace_min_km="5:40")
+    Run.objects.create(user=u, date=date(2025, 6, 5), run_type="TEMPO", distance_km=10, pace_min_km="4:35")
+    assert total("week", date(2025, 6, 2)) == (18, 2)
+    assert total("month", date(2025, 6, 1)) == (18, 2)
+
+    # moved to the previous week and month, then saved again on the same instance
+    run.date, run.distance_km = date(2025, 5, 30), 9
+    run.save()
+    run.distance_km = 9.5
+    run.save()
+    assert total("week", date(2025, 6, 2)) == (10, 1)
+    assert total("week", date(2025, 5, 26)) == (9.5, 1)
+    assert total("month", date(2025, 5, 1)) == (9.5, 1)
+
+    Run.objects.get(pk=run.pk).delete()
+    assert total("month", date(2025, 5, 1)) == (0, 0)
+
+    import_runs_csv(u.pk, "date,run_type,distance_km,pace_min_km\n2025-06-06,LONG,21.1,5:50\n")
+    assert total("week", date(2025, 6, 2)) == (31.1, 2)
+
+    assert reconcile_user(u.pk) == 2  # the emptied May rows
+    PeriodTotal.objects.filter(user=u, period="week").update(runs=7)
+    call_command("reconcile_goals", "--user", "patriktest32")
+    assert total("week", date(2025, 6, 2)) == (31.1, 2)
+
+
+# progress bars on every page and a streak that tolerates the running week
+@pytest.mark.django_db
+def test_goals_view_progress_and_streak(client):
+    from run.goals import goal_streak, period_start
+    from run.models import Goal
+
+    u = User.objects.create_user(username="patriktest33", password="patriktest33")
+    client.login(username="patriktest33", password="patriktest33")
+    client.post(reverse("goals"), {"metric": "distance", "period": "week", "target": "20"})
+    client.post(reverse("goals"), {"metric": "distance", "period": "week", "target": "15"})
+    goal = Goal.objects.get(user=u)
+    assert goal.target == 15
+
+    this_week = period_start("week", date.today())
+    for weeks_ago in (1, 2, 3, 5):
+        Run.objects.create(user=u, date=this_week - timedelta(weeks=weeks_ago), run_type="LONG", distance_km=16, pace_min_km="5:50")
+    assert goal_streak(goal) == 3
+
+    Run.objects.create(user=u, date=this_week, run_type="EASY", distance_km=6, pace_min_km="5:40")
+    resp = client.get(reverse("run_list"))
+    assert resp.context["goal_progress"][0]["percent"] == 40
+    assert "<progress" in resp.content.decode()
+
+    Run.objects.create(user=u, date=this_week, run_type="EASY", distance_km=10, pace_min_km="5:40")
+    resp = client.get(reverse("goals"))
+    assert resp.context["progress"][0]["streak"] == 4
+
+
+# streams are histogrammed against the zones, other runs estimated from their average;
+# the yearly report reads the weekly rows built by the worker
+@pytest.mark.django_db(transaction=True, databases=["default", "replica"])
+def test_weekly_zone_time_and_report(client):
+    from django.core.management import call_command
+    from run.models import HeartRateStream, Job, WeeklyZoneTime
+    from run.zone_time import stream_zone_seconds, zone_lookup, zone_table
+
+    u = User.objects.create_user(username="patriktest34", password="patriktest34")
+    ensure_default_zones(Profile.objects.create(user=u))
+    streamed = Run.objects.create(user=u, date=date(2025, 3, 4), run_type="INTERVAL", distance_km=5, pace_min_km="5:00")
+    # 600 s in Z1, 240 s in Z4, 60 s dropouts, 100 s in Z5
+    HeartRateStream.objects.create(run=streamed, user=u, samples=bytes([120] * 600 + [160] * 240 + [0] * 60 + [180] * 100))
+    Run.objects.create(user=u, date=date(2025, 3, 6), run_type="EASY", distance_km=10, pace_min_km="6:00", heart_rate="140")
+    Run.objects.create(user=u, date=date(2025, 3, 12), run_type="RECOVERY", distance_km=5, pace_min_km="6:30", zone="Z1")
+    table = zone_table(zone_lookup([(1, 100, 133), (5, 170, 255)]))
+    assert stream_zone_seconds(bytes([0, 99, 100, 255, 255]), table) == [1, 0, 0, 0, 2]
+    assert Job.objects.filter(user=u, kind="zone_weeks", status="queued").count() == 2
+
+    call_command("run_worker", "--once")
+    assert set(Job.objects.filter(user=u, kind="zone_weeks").values_list("status", "progress")) == {("done", 2), ("done", 1)}
+    week = WeeklyZoneTime.objects.get(user=u, week_start=date(2025, 3, 3))
+    assert week.zone_seconds == [600, 3600, 0, 240, 100]
+    assert week.estimated_seconds == 3600
+    assert WeeklyZoneTime.objects.get(user=u, week_start=date(2025, 3, 10)).z1_seconds == 1950
+
+    client.login(username="patriktest34", password="patriktest34")
+    report = client.get(reverse("zone_report"), {"year": 2025}).context["report"]
+    assert report["total_seconds"] == 6490
+    assert report["easy_percent"] == round(100 * 6150 / 6490, 1)
+    assert client.get(reverse("zone_report"), {"year": 10000}).status_code == 400
+
+    Run.objects.filter(pk=streamed.pk).get().delete()
+    call_command("run_worker", "--once")
+    assert WeeklyZoneTime.objects.get(user=u, week_start=date(2025, 3, 3)).zone_seconds == [0, 3600, 0, 0, 0]
+
+
+# an HR stream uploaded on the run page replaces the estimate in the weekly zones
+@pytest.mark.django_db(transaction=True)
+def test_hr_stream_upload(client):
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from django.core.management import call_command
+    from run.models import HeartRateStream, WeeklyZoneTime
+
+    u = User.objects.create_user(username="patriktest53", password="patriktest53")
+    ensure_default_zones(Profile.objects.create(user=u))
+    run = Run.objects.create(user=u, date=date(2025, 4, 2), run_type="EASY", distance_km=10, pace_min_km="6:00", heart_rate="140")
+    client.login(username="patriktest53", password="patriktest53")
+
+    resp = client.post(reverse("run_detail", args=[run.pk]), {"file": SimpleUploadedFile("hr.txt", b"120\nabc\n")})
+    assert resp.status_code == 200 and "Line 2" in resp.content.decode()
+    csv_text = "time,heart_rate\n" + "".join(f"{n},{120 if n < 300 else 160}\n" for n in range(400)) + "400,\n"
+    resp = client.post(reverse("run_detail", args=[run.pk]), {"file": SimpleUploadedFile("hr.csv", csv_text.encode())})
+    assert resp.status_code == 302
+    assert bytes(HeartRateStream.objects.get(run=run).samples) == bytes([120] * 300 + [160] * 100 + [0])
+    assert "401 s recorded" in client.get(reverse("run_detail", args=[run.pk])).content.decode()
+
+    call_command("run_worker", "--once")
+    week = WeeklyZoneTime.objects.get(user=u, week_start=date(2025, 3, 31))
+    assert week.zone_seconds == [300, 0, 0, 100, 0]
+    assert week.estimated_seconds == 0
+
+
+# only saves that change what the weekly zone time is built from queue a rebuild
+@pytest.mark.django_db
+def test_zone_weeks_queued_only_for_relevant_changes(django_capture_on_commit_callbacks):
+    from run.models import HeartRateStream, Job
+
+    u = User.objects.create_user(username="patriktest55", password="patriktest55")
+    jobs = Job.objects.filter(user=u, kind="zone_weeks")
+    with django_capture_on_commit_callbacks(execute=True):
+        plain = Run.objects.create(user=u, date=date(2025, 5, 6), run_type="EASY", distance_km=8, pace_min_km="6:00")
+        streamed = Run.objects.create(user=u, date=date(2025, 5, 13), run_type="EASY", distance_km=8, pace_min_km="6:00")
+        HeartRateStream.objects.create(run=streamed, user=u, samples=bytes([140] * 60))
+    jobs.delete()
+
+    def queued_after(run, **changes):
+        run = Run.objects.get(pk=run.pk)
+        for field, value in changes.items():
+            setattr(run, field, value)
+        with django_capture_on_commit_callbacks(execute=True):
+            run.save()
+        count = jobs.count()
+        jobs.delete()
+        return count
+
+    assert queued_after(plain, notes="felt good", distance_km=8) == 0
+    assert queued_after(plain, distance_km=9) == 1
+    assert queued_after(streamed, distance_km=9, heart_rate="150") == 0
+    assert queued_after(streamed, date=date(2025, 5, 14)) == 1
+
+
+# week sets with the same first and last week and size are different jobs
+@pytest.mark.django_db
+def test_zone_week_jobs_dedup_on_all_weeks():
+    from run.zone_time import enqueue_zone_weeks
+
+    u = User.objects.create_user(username="patriktest42", password="patriktest42")
+    a = enqueue_zone_weeks(u.pk, [date(2025, 3, 3), date(2025, 3, 10), date(2025, 3, 31)])
+    b = enqueue_zone_weeks(u.pk, [date(2025, 3, 3), date(2025, 3, 17), date(2025, 3, 31)])
+    assert a.pk != b.pk
+    assert enqueue_zone_weeks(u.pk, [date(2025, 3, 31), date(2025, 3, 11), date(2025, 3, 4)]).pk == a.pk
+
+
+# exported ZIP restores into another account with ids remapped
+@pytest.mark.django_db(transaction=True, databases=["default", "replica"])
+def test_account_export_and_restore(client, tmp_path):
+    import zipfile
+    from django.core.management import call_command
+    from run.models import Goal, HeartRateStream, Lap, PeriodTotal, run_fingerprint
+
+    u = User.objects.create_user(username="patriktest35", password="patriktest35")
+    ensure_default_zones(Profile.objects.create(user=u))
+    hills = Tag.objects.create(user=u, name="hills")
+    plan = TrainingPlan.objects.create(user=u, name="Marathon")
+    PlannedRun.objects.create(user=u, plan=plan, date=date(2025, 9, 1), run_type="LONG", distance_km=30)
+    run = Run.objects.create(user=u, date=date(2025, 8, 20), run_type="INTERVAL", distance_km=6, pace_min_km="4:30")
+    run.tags.add(hills)
+    Run.objects.create(user=u, date=date(2025, 8, 21), run_type="EASY", distance_km=8, pace_min_km="5:40",
+                       fingerprint=run_fingerprint(u.pk, date(2025, 8, 21), 8, "5:40"))
+    Lap.objects.create(run=run, user=u, number=1, distance_km=1, duration_seconds=230)
+    HeartRateStream.objects.create(run=run, user=u, samples=bytes([150, 160, 0]))
+    Goal.objects.create(user=u, metric="distance", period="week", target=40)
+    # more streams than fit one page, which holds only a few of them
+    from run.backup import STREAM_PAGE_SIZE, _stream_pages
+
+    for day in range(1, STREAM_PAGE_SIZE + 2):
+        extra = Run.objects.create(user=u, date=date(2025, 7, day), run_type="EASY", distance_km=5, pace_min_km="6:00")
+        HeartRateStream.objects.create(run=extra, user=u, samples=bytes([130] * day))
+    assert [len(page) for page in _stream_pages(u.pk, "default")] == [STREAM_PAGE_SIZE, 2]
+
+    client.login(username="patriktest35", password="patriktest35")
+    resp = client.get(reverse("account_export"))
+    assert resp["Content-Type"] == "application/zip"
+    path = tmp_path / "backup.zip"
+    path.write_bytes(b"".join(resp.streaming_content))
+    assert "runs.jsonl" in zipfile.ZipFile(path).namelist()
+
+    call_command("restore_account", "patriktest35b", str(path), "--create")
+    v = User.objects.get(username="patriktest35b")
+    restored = Run.objects.get(user=v, date=date(2025, 8, 20))
+    assert restored.pk != run.pk
+    assert list(restored.tags.values_list("name", flat=True)) == ["hills"]
+    assert restored.laps.get().duration_seconds == 230
+    assert bytes(restored.hr_stream.samples) == bytes([150, 160, 0])
+    assert PlannedRun.objects.get(user=v).plan.name == "Marathon"
+    assert v.profile.zones.count() == 5
+    assert Goal.objects.filter(user=v).count() == 1
+    assert PeriodTotal.objects.get(user=v, period="month", period_start=date(2025, 8, 1)).runs == 2
+    assert HeartRateStream.objects.filter(user=v).count() == STREAM_PAGE_SIZE + 2
+    assert Run.objects.get(user=v, date=date(2025, 8, 21)).fingerprint == run_fingerprint(v.pk, date(2025, 8, 21), 8, "5:40")
+
+    with pytest.raises(Exception, match="empty account"):
+        call_command("restore_account", "patriktest35b", str(path))
+
+
+# the run form renders only selected tags; the rest come from prefix search
+@pytest.mark.django_db
+def test_tag_autocomplete_and_run_form(client, django_assert_max_num_queries):
+    u = User.objects.create_user(username="patriktest36", password="patriktest36")
+    other = User.objects.create_user(username="patriktest36b", password="patriktest36b")
+    Tag.objects.bulk_create([Tag(user=u, name=f"tag{i:03d}") for i in range(300)])
+    foreign = Tag.objects.create(user=other, name="hills-other")
+    client.login(username="patriktest36", password="patriktest36")
+
+    with django_assert_max_num_queries(3):
+        body = client.get(reverse("run_create")).content.decode()
+    assert "tag000" not in body
+
+    found = client.get(reverse("tag_autocomplete"), {"q": "tag01"}).json()["results"]
+    assert [t["name"] for t in found] == [f"tag{i:03d}" for i in range(10, 20)]
+    assert client.get(reverse("tag_autocomplete"), {"q": "hills"}).json()["results"] == []
+
+    created = client.post(reverse("tag_autocomplete"), {"name": "hills"})
+    assert created.status_code == 201
+    hills = created.json()["id"]
+    assert client.post(reverse("tag_autocomplete"), {"name": "hills"}).json() == {"id": hills, "name": "hills", "created": False}
+
+    form_data = {"date": date(2025, 8, 25), "run_type": "EASY", "distance_km": "5", "pace_min_km": "5:30"}
+    resp = client.post(reverse("run_create"), data=dict(form_data, tags=[str(hills), str(foreign.pk)]))
+    assert resp.status_code == 200
+    assert list(resp.context["form"].fields["tags"].widget.choices) == [(hills, "hills")]
+    resp = client.post(reverse("run_create"), data=dict(form_data, tags=[str(hills)]))
+    assert resp.status_code in (301, 302)
+    assert list(Run.objects.get(user=u).tags.values_list("name", flat=True)) == ["hills"]
+
+
+# ranks come from one windowed query; finished periods are served from snapshots
+@pytest.mark.django_db
+def test_club_leaderboard_and_snapshots(client, django_assert_num_queries):
+    from run.leaderboard import compute_leaderboard, leaderboard
+    from run.models import Club, ClubMembership, LeaderboardSnapshot
+
+    owner = User.objects.create_user(username="patriktest37", password="patriktest37")
+    client.login(username="patriktest37", password="patriktest37")
+    client.post(reverse("club_list"), {"name": "Morning Club"})
+    club = Club.objects.get(owner=owner)
+    ana = User.objects.create_user(username="patriktest37a", password="x")
+    bob = User.objects.create_user(username="patriktest37b", password="x")
+    outsider = User.objects.create_user(username="patriktest37c", password="x")
+    ClubMembership.objects.create(club=club, user=ana)
+    ClubMembership.objects.create(club=club, user=bob)
+
+    week = date(2025, 6, 2)
+    for user, km in ((owner, 10), (owner, 5), (ana, 21.1), (bob, 8), (bob, 7), (outsider, 50)):
+        Run.objects.create(user=user, date=week + timedelta(days=2), run_type="EASY", distance_km=km, pace_min_km="5:30")
+
+    with django_assert_num_queries(1):
+        entries = compute_leaderboard(club.pk, "week", week)
+    assert [(e["username"], e["distance_rank"]) for e in entries] == [
+        ("patriktest37a", 1), ("patriktest37", 2), ("patriktest37b", 2),
+    ]
+    assert entries[0]["longest_rank"] == 1 and entries[0]["runs_rank"] == 3
+    assert entries[0]["share"] == round(100 * 21.1 / 51.1, 1)
+
+    assert leaderboard(club.pk, "week", week, today=date(2025, 6, 20)) == entries
+    Run.objects.create(user=bob, date=week, run_type="LONG", distance_km=30, pace_min_km="6:00")
+    # finished week is frozen, the current one is live
+    assert leaderboard(club.pk, "week", week, today=date(2025, 6, 20)) == entries
+    assert LeaderboardSnapshot.objects.filter(club=club).count() == 1
+    assert leaderboard(club.pk, "week", week, today=week)[0]["username"] == "patriktest37b"
+
+    resp = client.get(reverse("club_detail", args=[club.pk]), {"period": "month", "metric": "runs", "start": "2025-06-15"})
+    assert resp.context["start"] == date(2025, 6, 1)
+    assert resp.context["entries"][0]["username"] == "patriktest37b"
+    for start in ("9999-12-31", "0001-01-01"):
+        assert client.get(reverse("club_detail", args=[club.pk]), {"period": "month", "start": start}).status_code == 400
+
+    client.login(username="patriktest37c", password="x")
+    assert client.get(reverse("club_detail", args=[club.pk])).status_code == 404
+    client.post(reverse("club_join", args=[club.invite_code]))
+    assert client.get(reverse("club_detail", args=[club.pk])).status_code == 200
+
+
+# simulated load-test users get through login and CSRF for every action of the mix
+@pytest.mark.django_db(transaction=True)
+def test_loadtest_simulated_user_requests(settings):
+    import random
+    from PacePower.wsgi import application
+    from run.benchmarks import SimulatedUser, percentile, wsgi_request
+    from run.models import HeartRateZone
+
+    u = User.objects.create_user(username="patriktest38", password="patriktest38")
+    profile = Profile.objects.create(user=u)
+    ensure_default_zones(profile)
+    zones = list(HeartRateZone.objects.filter(profile=profile).values_list("id", "zone_number", "hr_min", "hr_max"))
+    sim = SimulatedUser(u, zones, random.Random(1))
+    settings.ALLOWED_HOSTS = ["localhost"]
+
+    statuses = {}
+    for _ in range(40):
+        action, method, path, body, headers = sim.next_request()
+        statuses.setdefault((action, method), set()).add(wsgi_request(application, path, method, body, headers)["status"])
+    assert statuses[("run_list", "GET")] == {200}
+    assert statuses[("run_create", "POST")] == {302}
+    assert all(codes <= {200, 302} for codes in statuses.values())
+    assert Run.objects.filter(user=u).exists()
+    assert percentile([5, 1, 3, 2, 4], 50) == 3 and percentile([5, 1, 3, 2, 4], 99) == 5
+
+
+# deleting users through a queryset, as loadtest --cleanup does, leaves nothing
+# behind for the deleted accounts
+@pytest.mark.django_db
+def test_queryset_user_delete_leaves_no_rows(django_capture_on_commit_callbacks):
+    from run.models import HeartRateStream, Job, PeriodTotal, Tombstone
+
+    u = User.objects.create_user(username="patriktest45", password="patriktest45")
+    run = Run.objects.create(user=u, date=date(2025, 5, 5), run_type="EASY", distance_km=6, pace_min_km="5:30")
+    HeartRateStream.objects.create(run=run, user=u, samples=bytes([140] * 60))
+    PlannedRun.objects.create(user=u, date=date(2025, 5, 6), run_type="LONG")
+    with django_capture_on_commit_callbacks(execute=True):
+        User.objects.filter(pk=u.pk).delete()
+    assert not Tombstone.objects.filter(user_id=u.pk).exists()
+    assert not PeriodTotal.objects.filter(user_id=u.pk).exists()
+    assert not Job.objects.filter(user_id=u.pk).exists()
@@ -3,11 +3,25 @@ from . import views
 
 
 urlpatterns = [
+    path("dashboard/", views.dashboard_view, name="dashboard"),
     path("runs/", views.run_list_view, name="run_list"),
     path("runs/new/", views.run_create_view, name="run_create"),
+    path("runs/import/", views.run_import_view, name="run_import"),
     path("runs/<int:pk>/", views.run_detail_view, name="run_detail"),
+    path("tags/autocomplete/", views.tag_autocomplete_view, name="tag_autocomplete"),
     path("profile/edit/", views.profile_edit_view, name="profile_edit"),
     path("plans/", views.plan_list_view, name="plan_list"),
     path("planned/new/", views.planned_run_create_view, name="planned_run_create"),
+    path("goals/", views.goals_view, name="goals"),
+    path("clubs/", views.club_list_view, name="club_list"),
+    path("clubs/<int:pk>/", views.club_detail_view, name="club_detail"),
+    path("clubs/join/<str:code>/", views.club_join_view, name="club_join"),
     path("calendar/", views.calendar_view, name="calendar_view"),
+    path("calendar/feed/<str:token>.ics", views.planned_ics_view, name="planned_ics"),
+    path("heatmap/", views.heatmap_view, name="heatmap"),
+    path("zones/", views.zone_report_view, name="zone_report"),
+    path("charts/", views.charts_view, name="charts"),
+    path("account/export/", views.account_export_view, name="account_export"),
+    path("sync/", views.sync_view, name="sync"),
+    path("jobs/<int:pk>/", views.job_status_view, name="job_status"),
 ]
@@ -0,0 +1,44 @@
+import time
+from django.db import transaction
+from .routers import pin_to_primary, state_cache
+
+
+# Per-user data versions kept in the shared 'state' cache (settings.CACHES), so a bump
+# made by one worker process is seen by all of them.
+#
+# A version is the time of the last change in microseconds, so it also works as
+# a Last-Modified value. An unknown (evicted) version restarts at "now", which
+# makes derived caches miss rather than match an older entry.
+
+
+def _key(user_id, scope):
+    return f"version:{scope}:{user_id}"
+
+
+def _now() -> int:
+    return time.time_ns() // 1000
+
+
+# Current version of a user's scope, e.g. "runs" or "runs:2024"
+def get_version(user_id, scope) -> int:
+    key = _key(user_id, scope)
+    version = state_cache.get(key)
+    if version is None:
+        state_cache.add(key, _now(), None)
+        version = state_cache.get(key)
+    return version
+
+
+# The user is pinned to the primary first, so whatever is cached under the new
+# version is not built from a replica that has not seen the change yet
+def _bump(user_id, scopes):
+    pin_to_primary(user_id)
+    now = _now()
+    for scope in scopes:
+        key = _key(user_id, scope)
+        state_cache.set(key, max(now, (state_cache.get(key) or 0) + 1), None)
+
+
+# Move scopes to a new version once the current transaction commits
+def bump_version(user_id, *scopes):
+    transaction.on_commit(lambda: _bump(user_id, scopes))
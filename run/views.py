@@ -1,9 +1,42 @@
+from asgiref.sync import sync_to_async
 from django.contrib.auth.decorators import login_required
+from django.core.paginator import Paginator
+from django.http import Http404, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
-from .forms import RunForm, ProfileForm, PlannedRunForm, TrainingPlanForm, HeartRateZoneFormSet
-from .models import Run, Profile, TrainingPlan, PlannedRun, ensure_default_zones, Tag
+from django.db.models.functions import Length
+from django.urls import reverse
+from django.views.decorators.http import condition
+from .forms import RunForm, ProfileForm, PlannedRunForm, TrainingPlanForm, HeartRateZoneFormSet, RunImportForm, GoalForm, ClubForm, HeartRateStreamForm
+from .models import Run, Profile, TrainingPlan, PlannedRun, ensure_default_zones, Tag, Job, Goal, Club, ClubMembership, HeartRateStream
+from .jobs import enqueue
+from .zone_time import enqueue_zone_weeks, polarisation_report
+from .routers import analytics_read, replica_alias_for
+from .backup import backup_filename, generate_backup
+from .fragments import render_run_rows
+from .goals import current_progress, goal_streak, period_start
+from .leaderboard import LEADERBOARD_METRICS, leaderboard, period_end, sort_entries
+from .laps import best_1km_rep, format_duration, save_laps, split_table
+from .sync import build_sync_page, SyncTokenError
+from .dashboard import aload_dashboard
+from .heatmap import year_in_review
+from .charts import trend_charts, default_range
+from .ical import feed_etag, feed_last_modified, feed_token, generate_feed, user_id_from_token
 from datetime import date as _date, timedelta
 import calendar
+import hashlib
+import secrets
+
+
+RUNS_PER_PAGE = 50
+TAG_RESULTS = 20
+
+
+# ?year= value as a year a date can hold; ValueError otherwise
+def _parse_year(value) -> int:
+    year = int(value)
+    if not _date.min.year <= year <= _date.max.year:
+        raise ValueError(f"year {year} out of range")
+    return year
 
 
 # display homepage
@@ -11,39 +44,110 @@ def home_view(request):
     return render(request, "run/home.html")
 
 
+# dashboard read through the async ORM on the request's one connection
+@login_required
+@analytics_read
+async def dashboard_view(request):
+    user = await request.auser()
+    ctx = await aload_dashboard(user.pk)
+    return await sync_to_async(render)(request, "run/dashboard.html", ctx)
+
+
 # create new run
 @login_required
 def run_create_view(request):
     if request.method == "POST":
-        form = RunForm(request.POST)
-        form.fields["tags"].queryset = Tag.objects.filter(user=request.user)
+        form = RunForm(request.POST, user=request.user)
         if form.is_valid():
             run = form.save(commit=False)
             run.user = request.user
             run.save()
             form.save_m2m()
+            save_laps(run, form.cleaned_data["laps"])
             return redirect("run_list")
     else:
-        form = RunForm()
-        form.fields["tags"].queryset = Tag.objects.filter(user=request.user)
+        form = RunForm(user=request.user)
     return render(request, "run/run_form.html", {"form": form})
 
 
+# prefix search over the user's tags (GET ?q=) and create-on-the-fly (POST name=)
+@login_required
+def tag_autocomplete_view(request):
+    if request.method == "POST":
+        name = request.POST.get("name", "").strip()
+        if not name or len(name) > Tag._meta.get_field("name").max_length:
+            return HttpResponseBadRequest("Tag name must be 1-30 characters")
+        tag, created = Tag.objects.get_or_create(user=request.user, name=name)
+        return JsonResponse({"id": tag.pk, "name": tag.name, "created": created}, status=201 if created else 200)
+    q = request.GET.get("q", "").strip()
+    tags = Tag.objects.filter(user=request.user)
+    if q:
+        tags = tags.filter(name__startswith=q)
+    results = [{"id": pk, "name": name} for pk, name in tags.order_by("name").values_list("id", "name")[:TAG_RESULTS]]
+    return JsonResponse({"results": results})
+
+
+# upload a CSV of runs, imported in the background
+@login_required
+def run_import_view(request):
+    job = None
+    if request.method == "POST":
+        form = RunImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            text = form.cleaned_data["file"]
+            job = enqueue(request.user, "import_runs", {"csv": text}, dedup_key=hashlib.sha1(text.encode()).hexdigest())
+            form = RunImportForm()
+    else:
+        form = RunImportForm()
+    return render(request, "run/run_import.html", {"form": form, "job": job})
+
+
 # list runs
 @login_required
 def run_list_view(request):
-    runs = Run.objects.filter(user=request.user).prefetch_related("tags").order_by("-date")
+    runs = Run.objects.filter(user=request.user).order_by("-date", "-id")
     tag_id = request.GET.get("tag")
     if tag_id:
         runs = runs.filter(tags__id=tag_id)
-    return render(request, "run/run_list.html", {"runs": runs})
+    # a date range lets PostgreSQL prune the yearly partitions of run_run
+    year = request.GET.get("year")
+    if year:
+        try:
+            year = _parse_year(year)
+        except ValueError:
+            return HttpResponseBadRequest("Invalid year")
+        runs = runs.filter(date__gte=_date(year, 1, 1), date__lte=_date(year, 12, 31))
+    page = Paginator(runs.values_list("id", "updated_at"), RUNS_PER_PAGE).get_page(request.GET.get("page"))
+    query = request.GET.copy()
+    query.pop("page", None)
+    ctx = {
+        "rows": render_run_rows(list(page)),
+        "page": page,
+        "year": year,
+        "query": f"{query.urlencode()}&" if query else "",
+    }
+    return render(request, "run/run_list.html", ctx)
 
 
 # show a single run
 @login_required
 def run_detail_view(request, pk: int):
     run = get_object_or_404(Run, pk=pk, user=request.user)
-    return render(request, "run/run_detail.html", {"run": run})
+    # an uploaded HR stream replaces the previous one; saving it queues the week's zone rebuild
+    if request.method == "POST":
+        stream_form = HeartRateStreamForm(request.POST, request.FILES)
+        if stream_form.is_valid():
+            HeartRateStream.objects.update_or_create(
+                run=run, defaults={"user": request.user, "samples": stream_form.cleaned_data["file"]},
+            )
+            return redirect("run_detail", pk=run.pk)
+    else:
+        stream_form = HeartRateStreamForm()
+    stream_seconds = HeartRateStream.objects.filter(run=run).values_list(Length("samples"), flat=True).first()
+    ctx = {"run": run, "splits": split_table(run), "stream_form": stream_form, "stream_seconds": stream_seconds}
+    if ctx["splits"]:
+        ctx["best_rep"] = best_1km_rep(request.user.pk)
+    return render(request, "run/run_detail.html", ctx)
 
 
 # edit HR zones in user profile
@@ -60,6 +164,9 @@ def profile_edit_view(request):
         if formset.is_valid():
             pform.save()
             formset.save()
+            if formset.has_changed():
+                enqueue(request.user, "reclassify_zones")
+                enqueue_zone_weeks(request.user.pk)
             return redirect("home")
     else:
         pform = ProfileForm(instance=profile)
@@ -93,6 +200,91 @@ def planned_run_create_view(request):
     return render(request, "run/planned_run_form.html", {"form": form})
 
 
+# set weekly/monthly goals and show progress with streaks
+@login_required
+def goals_view(request):
+    if request.method == "POST":
+        if "delete" in request.POST:
+            if request.POST["delete"].isdigit():
+                Goal.objects.filter(user=request.user, pk=request.POST["delete"]).delete()
+            return redirect("goals")
+        form = GoalForm(request.POST)
+        if form.is_valid():
+            Goal.objects.update_or_create(
+                user=request.user,
+                metric=form.cleaned_data["metric"],
+                period=form.cleaned_data["period"],
+                defaults={"target": form.cleaned_data["target"]},
+            )
+            return redirect("goals")
+    else:
+        form = GoalForm()
+    progress = current_progress(request.user.pk)
+    for item in progress:
+        item["streak"] = goal_streak(item["goal"])
+    return render(request, "run/goals.html", {"form": form, "progress": progress})
+
+
+# clubs the user belongs to, and creating a new one
+@login_required
+def club_list_view(request):
+    if request.method == "POST":
+        form = ClubForm(request.POST)
+        if form.is_valid():
+            club = form.save(commit=False)
+            club.owner = request.user
+            club.invite_code = secrets.token_urlsafe(12)
+            club.save()
+            ClubMembership.objects.create(club=club, user=request.user)
+            return redirect("club_detail", pk=club.pk)
+    else:
+        form = ClubForm()
+    clubs = Club.objects.filter(memberships__user=request.user).order_by("name")
+    return render(request, "run/club_list.html", {"clubs": clubs, "form": form})
+
+
+# join a club through its invite link
+@login_required
+def club_join_view(request, code):
+    club = get_object_or_404(Club, invite_code=code)
+    if request.method == "POST":
+        ClubMembership.objects.get_or_create(club=club, user=request.user)
+        return redirect("club_detail", pk=club.pk)
+    return render(request, "run/club_join.html", {"club": club})
+
+
+# weekly or monthly leaderboard, visible to members only
+@login_required
+def club_detail_view(request, pk):
+    club = get_object_or_404(Club, pk=pk, memberships__user=request.user)
+    period = request.GET.get("period", "week")
+    metric = request.GET.get("metric", "distance")
+    if period not in ("week", "month") or metric not in LEADERBOARD_METRICS:
+        return HttpResponseBadRequest("Unknown period or metric")
+    today = _date.today()
+    try:
+        start = _date.fromisoformat(request.GET["start"]) if request.GET.get("start") else today
+        # the neighbouring periods must still be dates
+        if not _date.min.year < start.year < _date.max.year:
+            raise ValueError(f"year {start.year} out of range")
+    except ValueError:
+        return HttpResponseBadRequest("Use a YYYY-MM-DD start date")
+    start = period_start(period, start)
+    entries = sort_entries(leaderboard(club.pk, period, start, today), metric)
+    ctx = {
+        "club": club,
+        "period": period,
+        "metric": metric,
+        "metrics": LEADERBOARD_METRICS,
+        "start": start,
+        "end": period_end(period, start) - timedelta(days=1),
+        "prev_start": period_start(period, start - timedelta(days=1)),
+        "next_start": period_end(period, start) if start < period_start(period, today) else None,
+        "entries": entries,
+        "invite_url": request.build_absolute_uri(reverse("club_join", args=[club.invite_code])),
+    }
+    return render(request, "run/club_detail.html", ctx)
+
 
 # month calendar with user's planned runs
 @login_required
@@ -117,9 +309,121 @@ def calendar_view(request):
         "year": year,
         "month": month,
         "items": items,
+        "feed_url": request.build_absolute_uri(reverse("planned_ics", args=[feed_token(request.user.pk)])),
         "prev_year": prev_month.year,
         "prev_month": prev_month.month,
         "next_year": next_month_first.year,
         "next_month": next_month_first.month,
     }
     return render(request, "run/calendar.html", ctx)
+
+
+# year in review heatmap of daily distance
+@login_required
+@analytics_read
+def heatmap_view(request):
+    try:
+        year = _parse_year(request.GET.get("year", _date.today().year))
+    except ValueError:
+        return HttpResponseBadRequest("Invalid year")
+    ctx = {
+        "year": year,
+        "prev_year": year - 1,
+        "next_year": year + 1 if year < _date.today().year else None,
+        "review": year_in_review(request.user.pk, year),
+    }
+    return render(request, "run/heatmap.html", ctx)
+
+
+# weekly time in zone for a year and how close it is to 80/20
+@login_required
+@analytics_read
+def zone_report_view(request):
+    try:
+        year = _parse_year(request.GET.get("year", _date.today().year))
+    except ValueError:
+        return HttpResponseBadRequest("Invalid year")
+    report = polarisation_report(request.user.pk, _date(year, 1, 1), _date(year, 12, 31))
+    weeks = [
+        {"week_start": w.week_start, "zones": [format_duration(s) for s in w.zone_seconds], "total": format_duration(sum(w.zone_seconds))}
+        for w in report["weeks"]
+    ]
+    ctx = {
+        "year": year,
+        "prev_year": year - 1,
+        "next_year": year + 1 if year < _date.today().year else None,
+        "report": report,
+        "weeks": weeks,
+        "zone_totals": [format_duration(s) for s in report["zone_seconds"]],
+    }
+    return render(request, "run/zone_report.html", ctx)
+
+
+# pace, volume and HR trend charts for a date range
+@login_required
+@analytics_read
+def charts_view(request):
+    start, end = default_range()
+    try:
+        start = _date.fromisoformat(request.GET.get("start", "")) if request.GET.get("start") else start
+        end = _date.fromisoformat(request.GET.get("end", "")) if request.GET.get("end") else end
+    except ValueError:
+        return HttpResponseBadRequest("Use YYYY-MM-DD dates")
+    if start > end:
+        start, end = end, start
+    ctx = {"start": start, "end": end, "charts": trend_charts(request.user.pk, start, end)}
+    return render(request, "run/charts.html", ctx)
+
+
+def _feed_user(token):
+    user_id = user_id_from_token(token)
+    if user_id is None:
+        raise Http404("Unknown calendar feed")
+    return user_id
+
+
+# iCalendar feed of planned runs; unchanged feeds answer 304 from the cached version
+# and the current day
+@condition(
+    etag_func=lambda request, token: feed_etag(_feed_user(token)),
+    last_modified_func=lambda request, token: feed_last_modified(_feed_user(token)),
+)
+def planned_ics_view(request, token):
+    response = StreamingHttpResponse(generate_feed(_feed_user(token)), content_type="text/calendar; charset=utf-8")
+    response["Content-Disposition"] = 'inline; filename="pacepower.ics"'
+    return response
+
+
+# full account backup, streamed as it is zipped; the response outlives the view,
+# so the replica is chosen here rather than with analytics_read
+@login_required
+def account_export_view(request):
+    using = replica_alias_for(request.user.pk) or "default"
+    response = StreamingHttpResponse(generate_backup(request.user, using), content_type="application/zip")
+    response["Content-Disposition"] = f'attachment; filename="{backup_filename(request.user)}"'
+    return response
+
+
+# changes since the client's last sync token, one page at a time
+@login_required
+def sync_view(request):
+    try:
+        page = build_sync_page(request.user, request.GET.get("since"), request.GET.get("limit"))
+    except SyncTokenError as exc:
+        return HttpResponseBadRequest(str(exc))
+    return JsonResponse(page)
+
+
+# status and progress of a background job
+@login_required
+def job_status_view(request, pk: int):
+    job = get_object_or_404(Job, pk=pk, user=request.user)
+    return JsonResponse({
+        "id": job.pk,
+        "kind": job.kind,
+        "status": job.status,
+        "attempts": job.attempts,
+        "progress": job.progress,
+        "progress_total": job.progress_total,
+        "result": job.payload.get("result") if job.status == "done" else None,
+    })
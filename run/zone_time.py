@@ -0,0 +1,168 @@
+import csv
+import hashlib
+import io
+from collections import defaultdict
+from datetime import timedelta
+from django.db import transaction
+from .goals import period_start
+from .jobs import enqueue
+from .models import HeartRateStream, Run, WeeklyZoneTime, parse_heart_rate
+from .zones import user_zones, zone_for_heart_rate
+
+
+ZONE_COUNT = 5
+RUN_CHUNK = 500
+MAX_STREAM_SECONDS = 24 * 60 * 60
+ZONE_FIELDS = [f"z{n}_seconds" for n in range(1, ZONE_COUNT + 1)]
+
+
+# Zone index (0-4) for every possible byte value, None outside the zones
+def zone_lookup(zones):
+    lookup = []
+    for hr in range(256):
+        label = zone_for_heart_rate(hr, zones) if hr else ""
+        number = int(label[1:]) if label else 0
+        lookup.append(number - 1 if 1 <= number <= ZONE_COUNT else None)
+    return lookup
+
+
+# Heart rate per second from an uploaded file: one value per line, or a CSV with a
+# heart_rate column; blank values are dropouts, stored as 0 and left out of the zones
+def parse_hr_stream(text: str) -> bytes:
+    lines = text.splitlines()
+    if lines and any(c.isalpha() for c in lines[0]):
+        reader = csv.DictReader(io.StringIO(text))
+        column = next((name for name in reader.fieldnames or [] if name.strip().lower() in ("heart_rate", "hr")), None)
+        if column is None:
+            raise ValueError("The CSV needs a heart_rate column")
+        values = [(row.get(column) or "") for row in reader]
+        first_line = 2
+    else:
+        values, first_line = lines, 1
+    if len(values) > MAX_STREAM_SECONDS:
+        raise ValueError(f"At most {MAX_STREAM_SECONDS} samples (one per second)")
+    samples = bytearray()
+    for lineno, value in enumerate(values, start=first_line):
+        value = value.strip()
+        try:
+            hr = round(float(value)) if value else 0
+        except (ValueError, OverflowError):
+            raise ValueError(f"Line {lineno}: {value!r} is not a heart rate")
+        if not 0 <= hr <= 255:
+            raise ValueError(f"Line {lineno}: heart rate must be between 0 and 255")
+        samples.append(hr)
+    if not any(samples):
+        raise ValueError("The file has no heart rate samples")
+    return bytes(samples)
+
+
+# 256-byte table mapping a sample to its zone number 1-5, 0 outside the zones
+def zone_table(lookup) -> bytes:
+    return bytes(0 if zone is None else zone + 1 for zone in lookup)
+
+
+# Seconds per zone of a 1 Hz stream: translate maps every sample to its zone byte
+# and count tallies each zone, both in C without a Python step per sample
+def stream_zone_seconds(samples: bytes, table):
+    zoned = bytes(samples).translate(table)
+    return [zoned.count(zone) for zone in range(1, ZONE_COUNT + 1)]
+
+
+# Whole run duration in the zone of its average HR (or stored zone label)
+def estimated_zone_seconds(run, zones):
+    label = zone_for_heart_rate(parse_heart_rate(run.heart_rate), zones) or run.zone
+    if not label.startswith("Z") or not label[1:].isdigit() or not 1 <= int(label[1:]) <= ZONE_COUNT:
+        return None
+    seconds = [0] * ZONE_COUNT
+    seconds[int(label[1:]) - 1] = round(run.distance_km * run.pace_seconds)
+    return seconds
+
+
+def _accumulate(runs, zones, totals):
+    table = zone_table(zone_lookup(zones))
+    runs = list(runs)
+    streams = dict(HeartRateStream.objects.filter(run_id__in=[r.id for r in runs]).values_list("run_id", "samples"))
+    for run in runs:
+        week = totals[period_start("week", run.date)]
+        if run.id in streams:
+            seconds = stream_zone_seconds(streams[run.id], table)
+        else:
+            seconds = estimated_zone_seconds(run, zones)
+            if seconds is None:
+                continue
+            week[ZONE_COUNT] += sum(seconds)
+        for i, value in enumerate(seconds):
+            week[i] += value
+
+
+# Rebuild the weekly aggregates of the given Monday dates, or of every week when None;
+# returns the number of runs examined
+def update_zone_weeks(user_id, weeks=None, progress=None):
+    zones = user_zones(user_id)
+    runs = Run.objects.filter(user_id=user_id).only("id", "date", "distance_km", "pace_min_km", "heart_rate", "zone")
+    if weeks is not None:
+        weeks = sorted(set(weeks))
+        if not weeks:
+            return 0
+        runs = runs.filter(date__gte=weeks[0], date__lt=weeks[-1] + timedelta(days=7))
+
+    totals = defaultdict(lambda: [0] * (ZONE_COUNT + 1))
+    examined, chunk = 0, []
+    for run in runs.order_by("id").iterator(chunk_size=RUN_CHUNK):
+        if weeks is not None and period_start("week", run.date) not in weeks:
+            continue
+        chunk.append(run)
+        if len(chunk) >= RUN_CHUNK:
+            _accumulate(chunk, zones, totals)
+            examined += len(chunk)
+            chunk = []
+            if progress:
+                progress(examined)
+    if chunk:
+        _accumulate(chunk, zones, totals)
+        examined += len(chunk)
+    if progress:
+        progress(examined)
+
+    rows = [
+        WeeklyZoneTime(user_id=user_id, week_start=week, estimated_seconds=values[ZONE_COUNT],
+                       **dict(zip(ZONE_FIELDS, values[:ZONE_COUNT])))
+        for week, values in sorted(totals.items()) if any(values[:ZONE_COUNT])
+    ]
+    with transaction.atomic():
+        stale = WeeklyZoneTime.objects.filter(user_id=user_id)
+        if weeks is not None:
+            stale = stale.filter(week_start__in=weeks)
+        stale.delete()
+        WeeklyZoneTime.objects.bulk_create(rows)
+    return examined
+
+
+# Queue a rebuild of the weeks containing these dates; identical waiting jobs are reused
+def enqueue_zone_weeks(user_id, dates=None):
+    if dates is None:
+        return enqueue(user_id, "zone_weeks", {"all": True}, dedup_key="all")
+    weeks = sorted({period_start("week", d).isoformat() for d in dates})
+    key = weeks[0] if len(weeks) == 1 else hashlib.sha1(",".join(weeks).encode()).hexdigest()
+    return enqueue(user_id, "zone_weeks", {"weeks": weeks}, dedup_key=key)
+
+
+# Time in zone between two dates read from the weekly rows, with the 80/20 split:
+# Z1-Z2 count as easy, Z3-Z5 as hard
+def polarisation_report(user_id, start, end):
+    weeks = list(
+        WeeklyZoneTime.objects.filter(user_id=user_id, week_start__gte=period_start("week", start), week_start__lte=end)
+        .order_by("week_start")
+    )
+    totals = [sum(getattr(w, field) for w in weeks) for field in ZONE_FIELDS]
+    total = sum(totals)
+    easy = totals[0] + totals[1]
+    return {
+        "weeks": weeks,
+        "zone_seconds": totals,
+        "zone_percent": [round(100 * s / total, 1) if total else 0 for s in totals],
+        "easy_percent": round(100 * easy / total, 1) if total else 0,
+        "hard_percent": round(100 * (total - easy) / total, 1) if total else 0,
+        "total_seconds": total,
+        "estimated_seconds": sum(w.estimated_seconds for w in weeks),
+    }
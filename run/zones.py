@@ -0,0 +1,58 @@
+from django.utils import timezone
+from .models import HeartRateZone, Run, parse_heart_rate
+from .versioning import bump_version
+
+
+BATCH_SIZE = 500
+
+
+# User's zones as (zone_number, hr_min, hr_max), lowest first
+def user_zones(user_id):
+    return list(
+        HeartRateZone.objects.filter(profile__user_id=user_id)
+        .order_by("zone_number")
+        .values_list("zone_number", "hr_min", "hr_max")
+    )
+
+
+# Zone label such as 'Z2' for an average heart rate, '' when outside all zones
+def zone_for_heart_rate(hr, zones) -> str:
+    if hr is None:
+        return ""
+    for number, lo, hi in zones:
+        if lo <= hr <= hi:
+            return f"Z{number}"
+    return ""
+
+
+# Re-derive Run.zone from the run's heart rate after the user's zones changed;
+# returns the number of runs examined
+def reclassify_runs(user_id, progress=None):
+    zones = user_zones(user_id)
+    if not zones:
+        return 0
+    runs = Run.objects.filter(user_id=user_id).exclude(heart_rate="").only("id", "heart_rate", "zone").order_by("id")
+    total = runs.count()
+    changed, batch, done = 0, [], 0
+    now = timezone.now()
+    for run in runs.iterator(chunk_size=BATCH_SIZE):
+        zone = zone_for_heart_rate(parse_heart_rate(run.heart_rate), zones)
+        if zone and zone != run.zone:
+            run.zone = zone
+            run.updated_at = now
+            batch.append(run)
+        done += 1
+        if len(batch) >= BATCH_SIZE:
+            changed += len(batch)
+            Run.objects.bulk_update(batch, ["zone", "updated_at"])
+            batch = []
+        if progress and done % BATCH_SIZE == 0:
+            progress(done, total)
+    if batch:
+        changed += len(batch)
+        Run.objects.bulk_update(batch, ["zone", "updated_at"])
+    if progress:
+        progress(done, total)
+    if changed:
+        bump_version(user_id, "runs")
+    return done